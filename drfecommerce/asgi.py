@@ -11,6 +11,16 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drfecommerce.settings")
+from drfecommerce.settings import base
+
+# same choice as manage.py, drfecommerce.settings itself is empty
+if base.DEBUG:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drfecommerce.settings.local")
+else:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drfecommerce.settings.production")
+
+# the settings turn persistent database connections off by default under ASGI
+# (see settings/production.py)
+os.environ.setdefault("DJANGO_ASGI", "1")
 
 application = get_asgi_application()
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+
+from .db import ReplicaState, current_request
+
+"""
+See: https://docs.djangoproject.com/en/4.1/topics/db/instrumentation/
+QueryBudgetMiddleware wraps every database query of a request, counting the queries,
+their total time and how often each query "shape" (fingerprint) ran. The same
+fingerprint running again and again is the typical sign of an N+1: one query per item
+of a list, where a single batched query would do.
+
+The numbers are sent back in a Server-Timing header (shown in the network tab of the
+browser dev tools, only with SERVER_TIMING, which local.py turns on) and logged to
+"drfecommerce.queries" at INFO level, with the values in extra fields for structured
+log handlers. Outside of local.py that logger only lets the warnings through.
+
+Views can declare how many queries a request may run, per action:
+
+    class ProductViewSet(viewsets.ViewSet):
+        query_budgets = {"list": 8, "retrieve": 6}
+
+and function views per http method, with the query_budget decorator:
+
+    @query_budget(get=2)
+    async def category_list(request):
+
+A request over budget is logged as a warning, or raises QueryBudgetExceeded with
+QUERY_BUDGET_STRICT = True (set for the whole test suite in tests/conftest.py), so a
+regression fails the tests of the endpoint. Streaming responses run their queries
+after the middleware is done, those are not counted.
+
+The middleware works in sync (WSGI) and async (ASGI) mode. Under ASGI the queries run
+in another thread than the middleware (every ORM call goes through sync_to_async), so
+the stats of the request are passed along in a context variable, which sync_to_async
+copies into that thread. record_query is installed on the connections of the thread
+that handles request_started, which is the thread the queries of the request run in.
+"""
+
+logger = logging.getLogger("drfecommerce.queries")
+
+# QueryStats of the request being handled, None outside of requests
+current_stats = ContextVar("query_stats", default=None)
+
+# "IN (%s, %s, %s)" is the same query, no matter how many values are in the list
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    # values are passed as parameters, so the sql itself is the shape of the query
+    return IN_LIST.sub("IN (...)", sql)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # See: https://docs.djangoproject.com/en/4.1/topics/db/instrumentation/#connection-execute-wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """
+        [(count, fingerprint)] of the queries that ran more than once, most frequent first.
+        """
+        return [
+            (count, sql) for sql, count in self.fingerprints.most_common() if count > 1
+        ]
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_recorder(**kwargs):
+    for connection in connections.all():
+        # first, since connection.execute_wrapper() removes the last wrapper on exit
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, record_query)
+
+
+request_started.connect(install_query_recorder)
+
+
+def query_budget(**budgets):
+    """
+    Sets the query budgets of a function view, per http method: @query_budget(get=2)
+    """
+
+    def decorator(view_func):
+        view_func.query_budgets = budgets
+        return view_func
+
+    return decorator
+
+
+def view_query_budget(view_func, request):
+    """
+    The query budget of the view that handles request, QUERY_BUDGET_DEFAULT if it has none.
+    """
+    # viewsets have them on the class, function views on the function
+    owner = getattr(view_func, "cls", view_func)
+    budgets = getattr(owner, "query_budgets", {})
+    # viewsets map the http method to an action, other views are looked up by method
+    method = request.method.lower()
+    action = (getattr(view_func, "actions", None) or {}).get(method, method)
+    return budgets.get(action, settings.QUERY_BUDGET_DEFAULT)
+
+
+class ContextMiddleware:
+    """
+    Runs the rest of the request with the context variable set to start(request), in
+    sync and async mode. finish(request, response, value) returns the response.
+    """
+
+    sync_capable = True
+    async_capable = True
+    variable = None
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # same switch as django.utils.deprecation.MiddlewareMixin
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        else:
+            self._is_coroutine = None
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        value = self.start(request)
+        token = self.variable.set(value)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.variable.reset(token)
+        return self.finish(request, response, value)
+
+    async def __acall__(self, request):
+        value = self.start(request)
+        token = self.variable.set(value)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.variable.reset(token)
+        return self.finish(request, response, value)
+
+
+class QueryBudgetMiddleware(ContextMiddleware):
+    variable = current_stats
+
+    def start(self, request):
+        return QueryStats()
+
+    def finish(self, request, response, stats):
+        self.report(request, response, stats)
+        return response
+
+    def report(self, request, response, stats):
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        # looked up here and not in process_view, which would cost a thread switch
+        # per request in async mode
+        budget = (
+            view_query_budget(match.func, request)
+            if match
+            else settings.QUERY_BUDGET_DEFAULT
+        )
+        duration = stats.duration * 1000
+        duplicates = stats.duplicates()
+        if settings.SERVER_TIMING:
+            timing = f'db;dur={duration:.1f};desc="{stats.count} queries"'
+            if duplicates:
+                timing += f', db-dup;desc="{len(duplicates)} repeated"'
+            if response.has_header("Server-Timing"):
+                timing = f"{response.headers['Server-Timing']}, {timing}"
+            response.headers["Server-Timing"] = timing
+
+        extra = {
+            "view": view,
+            "method": request.method,
+            "status": response.status_code,
+            "queries": stats.count,
+            "sql_ms": round(duration, 1),
+            "query_budget": budget,
+            "duplicates": duplicates,
+        }
+        logger.info(
+            "%s %s: %d queries in %.1fms",
+            request.method,
+            view,
+            stats.count,
+            duration,
+            extra=extra,
+        )
+        if budget is None or stats.count <= budget:
+            return
+        message = (
+            f"{request.method} {view} ran {stats.count} queries, "
+            f"its budget is {budget}."
+        )
+        if duplicates:
+            message += "\nRepeated queries:\n" + "\n".join(
+                f"{count}x {sql}" for count, sql in duplicates
+            )
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message, extra=extra)
+
+
+class ReplicaMiddleware(ContextMiddleware):
+    """
+    Passes the request on to ReplicaRouter, and keeps the reads of a client that wrote
+    on the primary for a while (see drfecommerce/db.py).
+    """
+
+    variable = current_request
+
+    def start(self, request):
+        return ReplicaState(request)
+
+    def finish(self, request, response, state):
+        if state.wrote:
+            state.pin(response)
+        return response
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProductConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "drfecommerce.product"
+
+    def ready(self):
+        # import the signal receivers so they get connected
+        from . import signals  # noqa: F401
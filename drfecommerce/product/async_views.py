@@ -0,0 +1,141 @@
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from drfecommerce.db import primary_reads, read_replica
+from drfecommerce.middleware import query_budget
+
+from .cache import aget_cached_product, aget_category_tree, aset_cached_product
+from .models import Category, Product
+from .pagination import ProductCursorPagination
+from .views import (
+    conditional_headers,
+    document_detail,
+    product_documents,
+    product_listing,
+    serialize_detail,
+    version_etag,
+)
+
+"""
+See: https://docs.djangoproject.com/en/4.1/topics/async/
+Async versions of the endpoints with most of the traffic, for running under ASGI
+(asgi.py, e.g. uvicorn drfecommerce.asgi:application):
+
+    /api/async/category/             CategoryViewSet.list
+    /api/async/category/tree/        CategoryViewSet.tree
+    /api/async/product/              ProductViewSet.list
+    /api/async/product/<slug>/       ProductViewSet.retrieve
+
+The output is the same as that of the viewsets: same JSON (rendered by DRF's
+JSONRenderer), same ETags and 304s, same 400 for invalid parameters. Only JSON though,
+DRF 3.14 has no async views, so these are plain Django views without the browsable API.
+
+A sync view holds a thread for the whole request under ASGI. These await the ORM
+(aaggregate, async for) and the cache (aget, aset) instead. Keep in mind that in
+Django 4.1 both still run the sync code in a thread (sync_to_async), one switch per
+call. The product list is built by DRF's cursor paginator and render.py, which are
+sync, so the whole page is built in a single switch instead of one per query.
+"""
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        headers=headers,
+        content_type="application/json",
+    )
+
+
+def error_response(exception):
+    # same body as rest_framework.views.exception_handler
+    detail = exception.detail
+    if not isinstance(detail, (list, dict)):
+        detail = {"detail": detail}
+    return json_response(detail, status=exception.status_code)
+
+
+def not_modified_response(headers):
+    return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def conditional_json_response(request, data, etag, last_modified=None):
+    headers, not_modified = conditional_headers(request, etag, last_modified)
+    if not_modified:
+        return not_modified_response(headers)
+    return json_response(data, headers=headers)
+
+
+@read_replica
+@query_budget(get=2)
+async def category_list(request):
+    queryset = Category.objects.all()
+    stats = await queryset.aaggregate(
+        last_modified=Max("updated_at"), count=Count("id")
+    )
+    headers, not_modified = conditional_headers(
+        request, version_etag(stats["last_modified"], stats["count"])
+    )
+    if not_modified:
+        return not_modified_response(headers)
+    # what CategorySerializer outputs. The same query as the viewset, the categories
+    # are not ordered and a .values_list("name") could come back in index order.
+    data = [{"category_name": category.name} async for category in queryset]
+    return json_response(data, headers=headers)
+
+
+@read_replica
+@query_budget(get=1)
+async def category_tree(request):
+    tree = await aget_category_tree()
+    return conditional_json_response(request, tree["data"], tree["etag"])
+
+
+@read_replica
+@query_budget(get=7)
+async def product_list(request):
+    def page():
+        # the paginator reads the parameters from a DRF request
+        etag, data = product_listing(
+            Request(request), Product.objects.is_active(), ProductCursorPagination()
+        )
+        if etag is None:
+            return {}, data()
+        headers, not_modified = conditional_headers(request, etag)
+        return headers, None if not_modified else data()
+
+    try:
+        headers, data = await sync_to_async(page)()
+    except APIException as e:
+        return error_response(e)
+    if data is None:
+        return not_modified_response(headers)
+    return json_response(data, headers=headers)
+
+
+@read_replica
+@query_budget(get=6)
+async def product_detail(request, slug):
+    entry = await aget_cached_product(slug)
+    if entry is None:
+        with primary_reads():
+            documents = [row async for row in product_documents(slug)]
+            if documents:
+                product_ids, data, last_modified = document_detail(documents)
+            else:
+                # not built yet (see rebuild_product_documents), serialize on the fly
+                product_ids, data, last_modified = await sync_to_async(
+                    serialize_detail
+                )(Product.objects.is_active().with_related().filter(slug=slug))
+        if not product_ids:
+            # unknown slugs are not cached, the product could be created any time
+            return json_response(data)
+        entry = await aset_cached_product(slug, product_ids, data, last_modified)
+    return conditional_json_response(
+        request, entry["data"], entry["etag"], entry["last_modified"]
+    )
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.http import quote_etag
+from rest_framework.utils.encoders import JSONEncoder
+
+from drfecommerce.db import primary_reads
+
+from .models import Category
+
+"""
+See: https://docs.djangoproject.com/en/4.1/topics/cache/#the-low-level-cache-api
+Read models that change rarely but are requested on every page view are built once
+and then served from the cache until one of the signals in signals.py invalidates them.
+
+Entries are versioned: invalidating only bumps the version counter, after which the
+old entries are never read again and simply expire from the cache backend.
+
+The functions starting with "a" are the async versions for the async views (see
+async_views.py), on the async methods of the cache backend.
+"""
+
+CATEGORY_TREE_KEY = "category_tree"
+CATEGORY_TREE_VERSION_KEY = "category_tree_version"
+FACET_INDEX_VERSION_KEY = "facet_index_version"
+
+PRODUCT_KEY = "product:{slug}"
+PRODUCT_VERSION_KEY = "product_version:{id}"
+PRODUCT_STATS_KEY = "product_cache_{name}"
+
+
+def get_version(key, backend=cache):
+    # the version starts at the current time, so if the counter ever gets evicted
+    # it cannot restart at a number that still has a stale entry stored under it.
+    return backend.get_or_set(key, time.time_ns(), timeout=None)
+
+
+async def aget_version(key, backend=cache):
+    return await backend.aget_or_set(key, time.time_ns(), timeout=None)
+
+
+def bump_version(key, backend=cache):
+    try:
+        backend.incr(key)
+    except ValueError:
+        # counter is not in the cache (yet), so there is nothing to invalidate
+        pass
+
+
+def category_tree_version():
+    return get_version(CATEGORY_TREE_VERSION_KEY)
+
+
+def invalidate_category_tree(**kwargs):
+    bump_version(CATEGORY_TREE_VERSION_KEY)
+
+
+def facet_index_version():
+    return get_version(FACET_INDEX_VERSION_KEY)
+
+
+def invalidate_facet_index():
+    # the index itself lives in the memory of every process (see filters.py),
+    # each of them rebuilds it on its next facet request.
+    bump_version(FACET_INDEX_VERSION_KEY)
+
+
+def category_tree_rows():
+    return Category.objects.order_by("tree_id", "lft").values(
+        "id", "parent_id", "name", "slug"
+    )
+
+
+def build_category_tree(categories=None):
+    """
+    Nested category tree, built from a single query (or the rows of that query).
+
+    Ordering by (tree_id, lft) returns every category after its parent (depth first),
+    so each node can be attached to its already created parent in one linear pass.
+    """
+    nodes = {}
+    tree = []
+    if categories is None:
+        categories = category_tree_rows()
+    for category in categories:
+        node = {
+            "category_name": category["name"],
+            "slug": category["slug"],
+            "children": [],
+        }
+        nodes[category["id"]] = node
+        if category["parent_id"] is None:
+            tree.append(node)
+        else:
+            nodes[category["parent_id"]]["children"].append(node)
+    return tree
+
+
+def get_category_tree():
+    """
+    Returns the cached {"etag": ..., "data": ...} document of the category tree.
+    """
+    version = category_tree_version()
+    document = cache.get(CATEGORY_TREE_KEY, version=version)
+    if document is None:
+        # cached until the next change, so not from a replica that may lag behind
+        with primary_reads():
+            data = build_category_tree()
+        document = {"etag": content_etag(data), "data": data}
+        cache.set(CATEGORY_TREE_KEY, document, timeout=None, version=version)
+    return document
+
+
+async def aget_category_tree():
+    version = await aget_version(CATEGORY_TREE_VERSION_KEY)
+    document = await cache.aget(CATEGORY_TREE_KEY, version=version)
+    if document is None:
+        with primary_reads():
+            data = build_category_tree([row async for row in category_tree_rows()])
+        document = {"etag": content_etag(data), "data": data}
+        await cache.aset(CATEGORY_TREE_KEY, document, timeout=None, version=version)
+    return document
+
+
+"""
+Product detail responses are cached per slug (the lookup field of ProductViewSet).
+The cache backend is pluggable through the PRODUCT_CACHE_ALIAS setting.
+
+The entry of a product records the product id and the versions it was built with.
+Changes only need the ids of the affected products to bump their versions (see
+signals.py), which also covers slug changes: the entry under the old slug can never
+match again.
+"""
+
+
+def product_cache():
+    return caches[settings.PRODUCT_CACHE_ALIAS]
+
+
+def count_product_lookup(name):
+    backend = product_cache()
+    key = PRODUCT_STATS_KEY.format(name=name)
+    try:
+        backend.incr(key)
+    except ValueError:
+        backend.add(key, 0, timeout=None)
+        backend.incr(key)
+
+
+async def acount_product_lookup(name):
+    backend = product_cache()
+    key = PRODUCT_STATS_KEY.format(name=name)
+    try:
+        await backend.aincr(key)
+    except ValueError:
+        await backend.aadd(key, 0, timeout=None)
+        await backend.aincr(key)
+
+
+def product_cache_stats():
+    backend = product_cache()
+    names = ("hits", "misses")
+    stats = backend.get_many([PRODUCT_STATS_KEY.format(name=name) for name in names])
+    return {name: stats.get(PRODUCT_STATS_KEY.format(name=name), 0) for name in names}
+
+
+def product_versions(product_ids):
+    backend = product_cache()
+    return [
+        get_version(PRODUCT_VERSION_KEY.format(id=pk), backend) for pk in product_ids
+    ]
+
+
+async def aproduct_versions(product_ids):
+    backend = product_cache()
+    return [
+        await aget_version(PRODUCT_VERSION_KEY.format(id=pk), backend)
+        for pk in product_ids
+    ]
+
+
+def content_etag(data):
+    content = json.dumps(data, sort_keys=True, cls=JSONEncoder).encode()
+    return quote_etag(hashlib.md5(content).hexdigest())
+
+
+def get_cached_product(slug):
+    """
+    Returns the cached {"data": ..., "etag": ..., "last_modified": ...} of a product.
+    """
+    entry = product_cache().get(PRODUCT_KEY.format(slug=slug))
+    if entry is not None and entry["versions"] == product_versions(entry["ids"]):
+        count_product_lookup("hits")
+        return entry
+    count_product_lookup("misses")
+    return None
+
+
+async def aget_cached_product(slug):
+    entry = await product_cache().aget(PRODUCT_KEY.format(slug=slug))
+    if entry is not None and entry["versions"] == await aproduct_versions(entry["ids"]):
+        await acount_product_lookup("hits")
+        return entry
+    await acount_product_lookup("misses")
+    return None
+
+
+def product_entry(product_ids, versions, data, last_modified):
+    return {
+        "ids": product_ids,
+        "versions": versions,
+        "data": data,
+        "etag": content_etag(data),
+        "last_modified": last_modified,
+    }
+
+
+def set_cached_product(slug, product_ids, data, last_modified):
+    # a change committed while data was being built can slip through here,
+    # PRODUCT_CACHE_TIMEOUT bounds how long such an entry can live.
+    entry = product_entry(
+        product_ids, product_versions(product_ids), data, last_modified
+    )
+    product_cache().set(
+        PRODUCT_KEY.format(slug=slug), entry, timeout=settings.PRODUCT_CACHE_TIMEOUT
+    )
+    return entry
+
+
+async def aset_cached_product(slug, product_ids, data, last_modified):
+    entry = product_entry(
+        product_ids, await aproduct_versions(product_ids), data, last_modified
+    )
+    await product_cache().aset(
+        PRODUCT_KEY.format(slug=slug), entry, timeout=settings.PRODUCT_CACHE_TIMEOUT
+    )
+    return entry
+
+
+def invalidate_products(product_ids):
+    backend = product_cache()
+    for pk in set(product_ids):
+        bump_version(PRODUCT_VERSION_KEY.format(id=pk), backend)
@@ -0,0 +1,46 @@
+from .models import Product, ProductDocument
+from .serializers import ProductSerializer
+
+"""
+Maintenance of the ProductDocument read model (see models.py).
+
+refresh_product_documents is called by the signals in signals.py with the products
+affected by a change, rebuild_product_documents by the management command of the same name.
+"""
+
+
+def refresh_product_documents(product_ids):
+    """
+    Recomputes the documents of the given products in one batch.
+
+    Products that are no longer active (or no longer exist) lose their document.
+    """
+    product_ids = list(product_ids)
+    products = list(
+        Product.objects.is_active().with_related().filter(pk__in=product_ids)
+    )
+    data = ProductSerializer(products, many=True).data
+    ProductDocument.objects.bulk_create(
+        [
+            ProductDocument(product=product, document=document)
+            for product, document in zip(products, data)
+        ],
+        update_conflicts=True,
+        unique_fields=["product"],
+        update_fields=["document", "updated_at"],
+    )
+    ProductDocument.objects.filter(product_id__in=product_ids).exclude(
+        product_id__in=[product.pk for product in products]
+    ).delete()
+
+
+def rebuild_product_documents(batch_size=500):
+    """
+    Recomputes the documents of all products, batch_size products at a time.
+
+    Returns the number of products processed.
+    """
+    product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(product_ids), batch_size):
+        refresh_product_documents(product_ids[start : start + batch_size])
+    return len(product_ids)
@@ -0,0 +1,77 @@
+import csv
+import json
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Product
+from .serializers import ProductSerializer
+
+"""
+Streaming catalog export, used by the product "export" endpoint and "manage.py export_catalog".
+
+See: https://docs.djangoproject.com/en/4.1/ref/models/querysets/#iterator
+The products are read with iterator(), which uses a server-side cursor where the database
+supports it. Since Django 4.1 iterator() also runs prefetch_related, once per chunk,
+so only chunk_size products (and their lines, images, ...) are in memory at any time.
+"""
+
+EXPORT_CHUNK_SIZE = 500
+
+PRODUCT_COLUMNS = ["name", "slug", "description", "category_name", "type specification"]
+LINE_COLUMNS = ["price", "sku", "stock_qty", "order", "product_image", "specification"]
+
+
+def export_products(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the ProductSerializer output of every active product, one product at a time.
+    """
+    if queryset is None:
+        queryset = Product.objects.is_active()
+    products = queryset.with_related().order_by("pk").iterator(chunk_size=chunk_size)
+    # shared by all chunks, so every product type is only resolved once (see get_attribute)
+    context = {}
+    while chunk := list(islice(products, chunk_size)):
+        yield from ProductSerializer(chunk, many=True, context=context).data
+
+
+def ndjson_lines(products):
+    for product in products:
+        yield json.dumps(product, cls=JSONEncoder) + "\n"
+
+
+class Echo:
+    # See: https://docs.djangoproject.com/en/4.1/howto/outputting-csv/#streaming-large-csv-files
+    # csv.writer returns what it writes, instead of buffering it.
+    def write(self, value):
+        return value
+
+
+def csv_lines(products):
+    """
+    One row per product line, products without lines get one row with empty line columns.
+
+    Nested values (images, specifications) are JSON encoded within their cell.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(PRODUCT_COLUMNS + LINE_COLUMNS)
+
+    def cell(value):
+        return (
+            json.dumps(value, cls=JSONEncoder)
+            if isinstance(value, (dict, list))
+            else value
+        )
+
+    for product in products:
+        row = [cell(product[column]) for column in PRODUCT_COLUMNS]
+        for line in product["product_line"] or [{}]:
+            yield writer.writerow(
+                row + [cell(line.get(column)) for column in LINE_COLUMNS]
+            )
+
+
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv"),
+}
@@ -1,6 +1,9 @@
+from collections import defaultdict
+
 from django.core import checks
-from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
 
 """
 Goal of the orderfield: Automatically add an increasing integer
@@ -8,11 +11,16 @@ to every new product-line of a given product.
 Will tell the front-end in which order to display items.
 
 In models.py, this is used as:
-order = OrderField(unique_for_field="product", blank=True)
-unique_for_field tells it to perform a query for each product separately.
+order = OrderField(unique_for_field="product", counter_field="last_line_order", blank=True)
+unique_for_field tells it to number the items of each product separately.
+counter_field is a column on the product that holds the last order handed out.
 blank=True since we dont want to add it manually (otherwise would get error).
 
-Watch lesson 66 for explanation of the code below.
+Watch lesson 66 for explanation of the original version of the code below.
+Reading the highest order and adding 1 is not safe when two items are added at the
+same time: both read the same value. Instead, the next value is taken from the counter
+with a single UPDATE, which locks the parent row until the transaction is done,
+so concurrent inserts for the same parent wait for each other and get distinct values.
 """
 
 
@@ -22,8 +30,9 @@ class OrderField(models.PositiveIntegerField):
         "An integer that is automatically incremented each time a new product is added."
     )
 
-    def __init__(self, unique_for_field=None, *args, **kwargs):
+    def __init__(self, unique_for_field=None, counter_field=None, *args, **kwargs):
         self.unique_for_field = unique_for_field
+        self.counter_field = counter_field
         super().__init__(*args, **kwargs)
 
     def check(self, **kwargs):
@@ -45,33 +54,102 @@ class OrderField(models.PositiveIntegerField):
                     "OrderField entered does not match an existing model field."
                 )
             ]
+        elif self.counter_field not in [
+            f.name for f in self.parent_model._meta.get_fields()
+        ]:
+            return [
+                checks.Error(
+                    "OrderField must define a 'counter_field' attribute "
+                    "that matches a field of the related model."
+                )
+            ]
         return []
 
+    @property
+    def parent_model(self):
+        return self.model._meta.get_field(self.unique_for_field).related_model
+
+    def allocate(self, parent_id, count=1, using=None):
+        """
+        Reserves count consecutive order values for the given parent, returns the first.
+
+        The counter never goes below the highest order in use,
+        so values that were entered by hand are skipped as well.
+        """
+        parents = self.parent_model._base_manager.using(using).filter(pk=parent_id)
+        highest = (
+            self.model._base_manager.filter(**{self.unique_for_field: OuterRef("pk")})
+            .order_by(f"-{self.attname}")
+            .values(self.attname)[:1]
+        )
+        with transaction.atomic(using=using):
+            parents.update(
+                **{
+                    self.counter_field: Greatest(
+                        F(self.counter_field), Coalesce(Subquery(highest), 0)
+                    )
+                    + count
+                }
+            )
+            last = parents.values_list(self.counter_field, flat=True).get()
+        return last - count + 1
+
+    def assign(self, objs, using=None):
+        """
+        Fills in the order of all objs that have none, with one allocation per parent.
+
+        To be called before bulk_create, otherwise every object allocates on its own.
+        """
+        parent_attname = self.model._meta.get_field(self.unique_for_field).attname
+        by_parent = defaultdict(list)
+        for obj in objs:
+            if getattr(obj, self.attname) is None:
+                by_parent[getattr(obj, parent_attname)].append(obj)
+        for parent_id, group in by_parent.items():
+            first = self.allocate(parent_id, len(group), using=using)
+            for offset, obj in enumerate(group):
+                setattr(obj, self.attname, first + offset)
+
     def pre_save(self, model_instance, add):
         """
         Every time new product line is created, the model fields pass through this function.
 
         First check if no value is provided (which we want, since it should add values automatically).
-        It will then filter the product lines for the current product. (add print(qs) to see it)
+        It will then take the next value from the counter of the current product.
         """
         if getattr(model_instance, self.attname) is None:
-            qs = self.model.objects.all()
-            try:
-                # the values below are for example:
-                # self.unique_for_field = product
-                # getattr(...) =  p1
-                query = {
-                    self.unique_for_field: getattr(
-                        model_instance, self.unique_for_field
-                    )
-                }
-                qs = qs.filter(**query)
-                # self.attname is for example "order" since we use order = OrderField() in product lines
-                last_item = qs.latest(self.attname)
-                value = last_item.order + 1
-            except ObjectDoesNotExist:
-                value = 1
-            return value
-        else:
-            # if value is provided in admin field, just return it
-            return super().pre_save(model_instance, add)
+            self.assign(
+                [model_instance],
+                using=router.db_for_write(self.model, instance=model_instance),
+            )
+        # if value is provided in admin field (or was just assigned), just return it
+        return super().pre_save(model_instance, add)
+
+
+class CopiedForeignKey(models.ForeignKey):
+    """
+    A foreign key that holds a copy of the same foreign key on a related row, e.g. in
+    models.py the attribute of the attribute value a product line is linked to:
+    attribute = CopiedForeignKey(Attribute, copy_from="attribute_value", ...)
+
+    Left empty, the copy is filled in when the row is inserted. pre_save also runs for
+    every row of bulk_create, which .add(), .set() and .create() of a many-to-many
+    relation use for their link rows, so those work without knowing about the copy.
+    Costs a lookup per row, unless the related row is already loaded.
+    """
+
+    def __init__(self, *args, copy_from=None, **kwargs):
+        self.copy_from = copy_from
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["copy_from"] = self.copy_from
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        if getattr(model_instance, self.attname) is None:
+            source = getattr(model_instance, self.copy_from)
+            if source is not None:
+                setattr(model_instance, self.attname, getattr(source, self.attname))
+        return super().pre_save(model_instance, add)
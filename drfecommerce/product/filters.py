@@ -0,0 +1,147 @@
+import threading
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import chain, repeat
+
+from rest_framework.exceptions import ValidationError
+
+from drfecommerce.db import primary_reads
+
+from .cache import facet_index_version
+from .models import AttributeValue, ProductLine, ProductLineAttributeValue
+
+"""
+Filtering product listings by specification, e.g. ?attr=1:red&attr=1:blue&attr=2:M
+Values of the same attribute are alternatives (red or blue), different attributes must
+all match, on the same product line (a red shirt in size M, not a red S and a blue M).
+?min_price=10&max_price=50&in_stock=true keep the products with an active line in
+that price range (and in stock), again on the same line as the attribute filters.
+All filters together are a single query, running on the (attribute_value, product_line)
+index of the link table and the (is_active, price) index of the product lines.
+
+Facet counts (number of products per attribute value within the results) would be a
+GROUP BY over every link row of the results, which takes hundreds of milliseconds for
+100k product lines. Instead, every process keeps the attribute values of every product
+in memory, numbered, as {product_id: (value number, ...)}. Counting is then a pass over
+the product ids of the results. Memory grows with the number of (product, value) pairs,
+so many distinct values (sizes, per-line codes) cost no more than a few shared ones.
+The index is rebuilt when signals.py reports a change of any product (see
+cache.invalidate_facet_index), stock reservations keep it (products_stock_changed).
+"""
+
+
+def parse_attribute_filters(params):
+    """
+    Turns the ?attr=<attribute_id>:<value> parameters into {attribute_id: [values]}.
+    """
+    filters = defaultdict(list)
+    for param in params:
+        attribute_id, _, value = param.partition(":")
+        if not attribute_id.isdigit() or not value:
+            raise ValidationError(
+                {"attr": f"'{param}' is not of the form <attribute_id>:<value>."}
+            )
+        filters[int(attribute_id)].append(value)
+    return filters
+
+
+def parse_line_filters(params):
+    """
+    Turns ?min_price, ?max_price and ?in_stock into lookups on the product lines.
+    """
+    lookups = {}
+    for param, lookup in (("min_price", "price__gte"), ("max_price", "price__lte")):
+        if param in params:
+            try:
+                lookups[lookup] = Decimal(params[param])
+            except InvalidOperation:
+                raise ValidationError({param: "A valid number is required."})
+    if params.get("in_stock") in ("true", "1"):
+        lookups["stock_qty__gt"] = 0
+    if lookups:
+        # prices and stock only count for lines that are for sale
+        lookups["is_active"] = True
+    return lookups
+
+
+def filter_by_lines(queryset, attribute_filters, line_filters):
+    """
+    Products that have a product line matching all filters, still a single query.
+    """
+    if not attribute_filters and not line_filters:
+        return queryset
+    lines = ProductLine.objects.filter(**line_filters)
+    for attribute_id, values in attribute_filters.items():
+        lines = lines.filter(
+            pk__in=ProductLineAttributeValue.objects.filter(
+                attribute_value__in=AttributeValue.objects.filter(
+                    attribute_id=attribute_id, attribute_value__in=values
+                ),
+            ).values("product_line_id")
+        )
+    return queryset.filter(pk__in=lines.values("product_id"))
+
+
+class FacetIndex:
+    def __init__(self):
+        # (version, [(attribute_id, value)], {product_id: (value number, ...)}),
+        # replaced as a whole, so a request never sees half of a rebuild
+        self.index = (None, [], {})
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        version = facet_index_version()
+        if self.index[0] != version:
+            with self.lock:
+                # another thread may have rebuilt it while this one was waiting
+                if self.index[0] != version:
+                    self.index = (version, *self.build())
+        return self.index
+
+    def build(self):
+        products = defaultdict(set)
+        links = ProductLineAttributeValue.objects.values_list(
+            "attribute_id",
+            "attribute_value__attribute_value",
+            "product_line__product_id",
+        )
+        # values of the same attribute with the same text are counted as one.
+        # kept until the next change, so not from a replica that may lag behind
+        with primary_reads():
+            for attribute_id, value, product_id in links.iterator(chunk_size=10000):
+                products[product_id].add((attribute_id, value))
+        # numbered in sorted order, so the counts come out sorted as well
+        values = sorted({key for keys in products.values() for key in keys})
+        numbers = {key: number for number, key in enumerate(values)}
+        return values, {
+            product_id: tuple(numbers[key] for key in keys)
+            for product_id, keys in products.items()
+        }
+
+    def counts(self, product_ids):
+        """
+        Number of products per attribute value, {attribute_id: {value: count}}.
+        """
+        _, values, products = self.refresh()
+        # one pass in C over the value numbers of the results
+        counts = Counter(
+            chain.from_iterable(map(products.get, product_ids, repeat(())))
+        )
+        facets = defaultdict(dict)
+        for number in sorted(counts):
+            attribute_id, value = values[number]
+            facets[attribute_id][value] = counts[number]
+        return facets
+
+
+facet_index = FacetIndex()
+
+
+def attribute_facets(queryset):
+    """
+    Facet counts of all products of queryset (not just the current page).
+
+    Costs one query for the product ids, plus the rebuild of the index after a change.
+    """
+    product_ids = queryset.prefetch_related(None).values_list("pk", flat=True)
+    return facet_index.counts(product_ids.order_by())
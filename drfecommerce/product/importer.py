@@ -0,0 +1,272 @@
+import csv
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import (
+    Attribute,
+    AttributeValue,
+    Category,
+    Product,
+    ProductLine,
+    ProductLineAttributeValue,
+    ProductType,
+)
+from .signals import products_changed
+
+"""
+Bulk catalog import, used by "manage.py import_catalog".
+
+Every record is one product line together with the product it belongs to:
+
+    pid, name, slug, description, category (slug), product_type (name), is_digital,
+    is_active, sku, price, stock_qty, weight, line_is_active,
+    line_product_type (name, defaults to product_type), attributes
+
+In JSONL files attributes is an object {"color": "red"}, in CSV files "color=red|size=M".
+Products are matched by pid: the first record of a new pid creates the product,
+records of an existing pid only add lines to it.
+
+Records are processed in batches. Every lookup of a batch (categories, types, attributes,
+existing products, slugs and skus) is one query for the whole batch, rows are written
+with bulk_create, so the per-row queries of save()/full_clean() never run.
+Invalid records are skipped and reported, the rest of the batch is imported. A new
+product is only created if at least one of its lines is valid.
+"""
+
+PRODUCT_FIELDS = ["pid", "name", "slug", "description", "is_digital", "is_active"]
+
+
+def read_records(file, format):
+    """
+    Yields (line number, record) pairs of a CSV or JSONL file, one line at a time.
+    """
+    if format == "csv":
+        reader = csv.DictReader(file)
+        for record in reader:
+            # empty cells are treated like missing keys, so the model defaults apply
+            record = {key: value for key, value in record.items() if value != ""}
+            record["attributes"] = dict(
+                item.split("=", 1)
+                for item in record.get("attributes", "").split("|")
+                if item
+            )
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, ValidationError(f"Invalid JSON: {e}")
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=1000, refresh_documents=True):
+        self.batch_size = batch_size
+        self.refresh_documents = refresh_documents
+        # lookups are cached for the whole import, every batch only queries new keys
+        self.categories = {}
+        self.product_types = {}
+        self.attributes = {}
+        self.attribute_values = {}
+        self.products_created = 0
+        self.lines_created = 0
+        self.errors = []
+        # pid: error of the products that could not be created, later records of
+        # the same pid (in any batch) are rejected with the same error
+        self.failed = {}
+
+    def run(self, records):
+        records = iter(records)
+        while batch := list(islice(records, self.batch_size)):
+            self.import_batch(batch)
+        return self
+
+    def load(self, cache, queryset, field, keys):
+        missing = {key for key in keys if key and key not in cache}
+        if missing:
+            cache.update(
+                queryset.filter(**{f"{field}__in": missing}).values_list(field, "pk")
+            )
+
+    def lookup(self, cache, key, label, required=True):
+        if not key:
+            if required:
+                raise ValidationError(f"A {label} is required.")
+            return None
+        if key not in cache:
+            raise ValidationError(f"Unknown {label} '{key}'.")
+        return cache[key]
+
+    def import_batch(self, batch):
+        rows = []
+        for line_number, record in batch:
+            if isinstance(record, ValidationError):
+                self.errors.append((line_number, record.messages))
+            else:
+                rows.append((line_number, record))
+
+        self.load(
+            self.categories,
+            Category.objects,
+            "slug",
+            [r.get("category") for _, r in rows],
+        )
+        types = [
+            r.get(f) for _, r in rows for f in ("product_type", "line_product_type")
+        ]
+        self.load(self.product_types, ProductType.objects, "name", types)
+        names = [name for _, r in rows for name in r.get("attributes") or {}]
+        self.load(self.attributes, Attribute.objects, "name", names)
+        existing = dict(
+            Product.objects.filter(pid__in={r.get("pid") for _, r in rows}).values_list(
+                "pid", "pk"
+            )
+        )
+
+        # first pass: the new products
+        products = {}
+        for line_number, record in rows:
+            pid = record.get("pid")
+            if pid in existing or pid in products or pid in self.failed:
+                continue
+            try:
+                product = Product(
+                    **{
+                        field: record[field]
+                        for field in PRODUCT_FIELDS
+                        if field in record
+                    },
+                    category_id=self.lookup(
+                        self.categories, record.get("category"), "category", False
+                    ),
+                    product_type_id=self.lookup(
+                        self.product_types, record.get("product_type"), "product type"
+                    ),
+                )
+                product.clean_fields(exclude=["category", "product_type"])
+                products[pid] = product
+            except ValidationError as e:
+                self.failed[pid] = e
+        # slugs must be unique, among existing products and within the batch
+        taken = set(
+            Product.objects.filter(
+                slug__in=[product.slug for product in products.values()]
+            ).values_list("slug", flat=True)
+        )
+        for pid, product in list(products.items()):
+            if product.slug in taken:
+                self.failed[pid] = ValidationError(
+                    f"Slug '{product.slug}' is already in use."
+                )
+                del products[pid]
+            taken.add(product.slug)
+
+        # second pass: the product lines and their specification
+        # skus must be unique as well
+        taken = set(
+            ProductLine.objects.filter(
+                sku__in=[r.get("sku") for _, r in rows]
+            ).values_list("sku", flat=True)
+        )
+        lines = []
+        for line_number, record in rows:
+            pid = record.get("pid")
+            if pid in self.failed:
+                self.errors.append((line_number, self.failed[pid].messages))
+                continue
+            try:
+                if record.get("sku") in taken:
+                    raise ValidationError(f"SKU '{record['sku']}' is already in use.")
+                line = ProductLine(
+                    sku=record.get("sku"),
+                    price=record.get("price"),
+                    stock_qty=record.get("stock_qty"),
+                    weight=record.get("weight"),
+                    is_active=record.get("line_is_active", False),
+                    product_type_id=self.lookup(
+                        self.product_types,
+                        record.get("line_product_type") or record.get("product_type"),
+                        "product type",
+                    ),
+                )
+                if pid in products:
+                    line.product = products[pid]
+                else:
+                    line.product_id = existing[pid]
+                line.clean_fields(exclude=["product", "product_type", "order"])
+                taken.add(line.sku)
+                attributes = {
+                    self.lookup(self.attributes, name, "attribute"): str(value)
+                    for name, value in (record.get("attributes") or {}).items()
+                }
+            except ValidationError as e:
+                self.errors.append((line_number, e.messages))
+                continue
+            lines.append((line, attributes))
+
+        # products none of whose lines made it are not created at all
+        with_lines = {line.product.pid for line, _ in lines if line.product_id is None}
+        products = {pid: p for pid, p in products.items() if pid in with_lines}
+        with transaction.atomic():
+            self.create(products, lines)
+
+    def create(self, products, lines):
+        # lines of products created in this batch are numbered right here, nobody else
+        # can see these products before the commit. Existing products go through
+        # OrderField.assign, one counter allocation per product.
+        for line, _ in lines:
+            if line.product_id is None:
+                line.product.last_line_order += 1
+                line.order = line.product.last_line_order
+        Product.objects.bulk_create(products.values())
+        ProductLine._meta.get_field("order").assign([line for line, _ in lines])
+        ProductLine.objects.bulk_create([line for line, _ in lines])
+
+        pairs = {pair for _, attributes in lines for pair in attributes.items()}
+        self.create_attribute_values(pairs)
+        ProductLineAttributeValue.objects.bulk_create(
+            [
+                ProductLineAttributeValue(
+                    product_line=line,
+                    attribute_id=pair[0],
+                    attribute_value_id=self.attribute_values[pair],
+                )
+                for line, attributes in lines
+                for pair in attributes.items()
+            ]
+        )
+
+        self.products_created += len(products)
+        self.lines_created += len(lines)
+        # bulk_create sends no signals, so documents and caches are refreshed here
+        products_changed(
+            [line.product_id for line, _ in lines]
+            + [product.pk for product in products.values()],
+            documents=self.refresh_documents,
+        )
+
+    def create_attribute_values(self, pairs):
+        missing = {pair for pair in pairs if pair not in self.attribute_values}
+        if not missing:
+            return
+        existing = AttributeValue.objects.filter(
+            attribute_id__in={attribute_id for attribute_id, _ in missing},
+            attribute_value__in={value for _, value in missing},
+        ).values_list("attribute_id", "attribute_value", "pk")
+        for attribute_id, value, pk in existing:
+            self.attribute_values[(attribute_id, value)] = pk
+        created = AttributeValue.objects.bulk_create(
+            [
+                AttributeValue(attribute_id=attribute_id, attribute_value=value)
+                for attribute_id, value in missing
+                if (attribute_id, value) not in self.attribute_values
+            ]
+        )
+        for attribute_value in created:
+            self.attribute_values[
+                (attribute_value.attribute_id, attribute_value.attribute_value)
+            ] = attribute_value.pk
@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from drfecommerce.product.export import (
+    EXPORT_CHUNK_SIZE,
+    EXPORT_FORMATS,
+    export_products,
+)
+
+"""
+See: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+Usage: python manage.py export_catalog [catalog.csv] [--format ndjson|csv] [--chunk-size 500]
+Without a path, the catalog is written to stdout.
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports all active products as NDJSON or CSV, in the shape of the product API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path, nargs="?")
+        parser.add_argument(
+            "--format",
+            choices=list(EXPORT_FORMATS),
+            help="File format, by default taken from the file extension (or ndjson).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help="Number of products fetched and serialized together.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"]
+        if format is None:
+            suffix = path.suffix.lstrip(".").lower() if path else ""
+            format = "csv" if suffix == "csv" else "ndjson"
+        lines, _ = EXPORT_FORMATS[format]
+        products = export_products(chunk_size=options["chunk_size"])
+
+        if path is None:
+            # self.stdout would add a newline to every csv row
+            sys.stdout.writelines(lines(products))
+            return
+        count = 0
+        with path.open("w", newline="", encoding="utf-8") as file:
+            for line in lines(products):
+                file.write(line)
+                count += 1
+        self.stderr.write(self.style.SUCCESS(f"Wrote {count} lines to {path}."))
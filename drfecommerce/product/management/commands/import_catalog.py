@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from drfecommerce.product.importer import CatalogImporter, read_records
+
+"""
+See: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+Usage: python manage.py import_catalog catalog.jsonl [--batch-size 1000] [--skip-documents]
+The expected columns are described in product/importer.py.
+"""
+
+
+class Command(BaseCommand):
+    help = "Imports products and product lines from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="File format, by default taken from the file extension.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of records validated and inserted together.",
+        )
+        parser.add_argument(
+            "--skip-documents",
+            action="store_true",
+            help="Do not refresh the product documents, "
+            "run rebuild_product_documents afterwards instead. "
+            "Cached responses, facets and the search index are still refreshed.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or path.suffix.lstrip(".").lower()
+        if format == "ndjson":
+            format = "jsonl"
+        if format not in ("csv", "jsonl"):
+            raise CommandError(f"Cannot tell the format of {path}, use --format.")
+        if not path.exists():
+            raise CommandError(f"{path} does not exist.")
+
+        importer = CatalogImporter(
+            batch_size=options["batch_size"],
+            refresh_documents=not options["skip_documents"],
+        )
+        with path.open(newline="", encoding="utf-8") as file:
+            importer.run(read_records(file, format))
+
+        for line_number, messages in importer.errors:
+            self.stderr.write(f"line {line_number}: {' '.join(messages)}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {importer.products_created} products and "
+                f"{importer.lines_created} product lines, "
+                f"skipped {len(importer.errors)} invalid records."
+            )
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from drfecommerce.product.documents import rebuild_product_documents
+
+"""
+See: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+Usage: python manage.py rebuild_product_documents [--batch-size 500]
+"""
+
+
+class Command(BaseCommand):
+    help = "Recomputes the ProductDocument read model of all products."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of products serialized per batch.",
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_product_documents(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt documents of {count} products."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from drfecommerce.product.search import rebuild_search_index
+
+"""
+See: https://docs.djangoproject.com/en/4.1/howto/custom-management-commands/
+Usage: python manage.py rebuild_search_index [--batch-size 500]
+"""
+
+
+class Command(BaseCommand):
+    help = "Fills the product search table from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of products indexed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products."))
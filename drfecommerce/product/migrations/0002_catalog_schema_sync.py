@@ -0,0 +1,137 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductAttributeValue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "attribute_value",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="product_value_av",
+                        to="product.attributevalue",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RenameField(
+            model_name="productimage",
+            old_name="productline",
+            new_name="product_line",
+        ),
+        migrations.RemoveField(
+            model_name="product",
+            name="brand",
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="pid",
+            field=models.CharField(default="", max_length=10, unique=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="productline",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="productline",
+            name="product_type",
+            field=models.ForeignKey(
+                default=1,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="product_line_type",
+                to="product.producttype",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="productline",
+            name="weight",
+            field=models.FloatField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="producttype",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="product.producttype",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="product_type",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="product_type",
+                to="product.producttype",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="productline",
+            name="product",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="product_line",
+                to="product.product",
+            ),
+        ),
+        migrations.DeleteModel(
+            name="Brand",
+        ),
+        migrations.AddField(
+            model_name="productattributevalue",
+            name="product",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="product_value_pl",
+                to="product.product",
+            ),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="attribute_value",
+            field=models.ManyToManyField(
+                related_name="product_attr_value",
+                through="product.ProductAttributeValue",
+                to="product.attributevalue",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="productattributevalue",
+            unique_together={("product", "attribute_value")},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0002_catalog_schema_sync"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["created_at", "id"], name="product_pro_created_fbec9b_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0003_product_created_at_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(
+                fields=["tree_id", "lft", "rght"], name="category_tree_range_idx"
+            ),
+        ),
+    ]
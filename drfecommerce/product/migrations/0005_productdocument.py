@@ -0,0 +1,30 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0004_category_tree_range_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductDocument",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="document",
+                        serialize=False,
+                        to="product.product",
+                    ),
+                ),
+                ("document", models.JSONField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0005_productdocument"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="last_line_order",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="productline",
+            name="last_image_order",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0006_order_counters"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="productimage",
+            constraint=models.UniqueConstraint(
+                fields=("product_line", "order"), name="unique_product_image_order"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="productline",
+            constraint=models.UniqueConstraint(
+                fields=("product", "order"), name="unique_product_line_order"
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.1.6 on 2026-10-18 02:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_attribute(apps, schema_editor):
+    # fill the new column from the linked attribute values
+    ProductLineAttributeValue = apps.get_model("product", "ProductLineAttributeValue")
+    AttributeValue = apps.get_model("product", "AttributeValue")
+    ProductLineAttributeValue.objects.update(
+        attribute_id=models.Subquery(
+            AttributeValue.objects.filter(
+                pk=models.OuterRef("attribute_value_id")
+            ).values("attribute_id")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0007_order_unique_constraints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productlineattributevalue",
+            name="attribute",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="product_line_attribute_value_a",
+                to="product.attribute",
+            ),
+        ),
+        migrations.RunPython(copy_attribute, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="productlineattributevalue",
+            name="attribute",
+            field=models.ForeignKey(
+                editable=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="product_line_attribute_value_a",
+                to="product.attribute",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="productlineattributevalue",
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name="productlineattributevalue",
+            constraint=models.UniqueConstraint(
+                fields=("product_line", "attribute"),
+                name="unique_product_line_attribute",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0008_productlineattributevalue_attribute"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="productlineattributevalue",
+            index=models.Index(
+                fields=["attribute_value", "product_line"],
+                name="product_pro_attribu_40859a_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.6 on 2026-10-18 02:40
+
+from django.db import migrations
+
+# The search table is not a model, its layout depends on the database (see search.py).
+SCHEMA = {
+    "sqlite": {
+        "create": [
+            "CREATE VIRTUAL TABLE product_search USING fts5("
+            "name, category, attributes, description, tokenize='porter unicode61')"
+        ],
+        "drop": ["DROP TABLE product_search"],
+    },
+    "postgresql": {
+        "create": [
+            "CREATE TABLE product_search ("
+            "product_id bigint PRIMARY KEY "
+            "REFERENCES product_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "search_vector tsvector NOT NULL)",
+            "CREATE INDEX product_search_vector_idx "
+            "ON product_search USING gin (search_vector)",
+        ],
+        "drop": ["DROP TABLE product_search"],
+    },
+}
+
+
+def run(action):
+    def operation(apps, schema_editor):
+        for sql in SCHEMA.get(schema_editor.connection.vendor, {}).get(action, []):
+            schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0009_product_line_attribute_value_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(run("create"), run("drop")),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0010_product_search"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="productline",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["price"],
+                name="active_line_price_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productline",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["product", "price"],
+                name="active_line_product_price_idx",
+            ),
+        ),
+    ]
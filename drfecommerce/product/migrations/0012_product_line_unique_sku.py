@@ -0,0 +1,41 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:46
+
+from django.core.management.base import CommandError
+from django.db import migrations, models
+
+
+def check_duplicate_skus(apps, schema_editor):
+    # the skus were never unique (the test factory gave every line "12345"), which
+    # lines keep which sku can't be decided here: stop with the list instead of an
+    # IntegrityError halfway through the migration.
+    ProductLine = apps.get_model("product", "ProductLine")
+    duplicates = list(
+        ProductLine.objects.using(schema_editor.connection.alias)
+        .values("sku")
+        .annotate(lines=models.Count("pk"))
+        .filter(lines__gt=1)
+        .order_by("sku")
+        .values_list("sku", "lines")
+    )
+    if duplicates:
+        listed = ", ".join(f"'{sku}' ({lines} lines)" for sku, lines in duplicates[:20])
+        more = f" and {len(duplicates) - 20} more" if len(duplicates) > 20 else ""
+        raise CommandError(
+            f"{len(duplicates)} skus are used by more than one product line: "
+            f"{listed}{more}. Give those lines unique skus, then run migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0011_product_line_price_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_skus, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="productline",
+            name="sku",
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.6 on 2026-10-18 02:31
+
+from django.db import migrations
+import django.db.models.deletion
+import drfecommerce.product.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("product", "0013_updated_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="productlineattributevalue",
+            name="attribute",
+            field=drfecommerce.product.fields.CopiedForeignKey(
+                copy_from="attribute_value",
+                editable=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="product_line_attribute_value_a",
+                to="product.attribute",
+            ),
+        ),
+    ]
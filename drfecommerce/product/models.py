@@ -1,8 +1,9 @@
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db.models.signals import m2m_changed
 from mptt.models import MPTTModel, TreeForeignKey
 
-from .fields import OrderField
+from .fields import CopiedForeignKey, OrderField
 
 
 class IsActiveQueryset(models.QuerySet):
@@ -10,6 +11,109 @@ class IsActiveQueryset(models.QuerySet):
         return self.filter(is_active=True)
 
 
+class ProductQueryset(IsActiveQueryset):
+    def with_price_range(self):
+        """
+        Annotates min_price and max_price, over the active lines of each product.
+
+        Each is a correlated subquery that reads a single entry of the
+        (product, price) index of the active lines, so the prices can be filtered and sorted on
+        in SQL (see pagination.py) without loading any product line.
+        """
+        lines = ProductLine.objects.filter(
+            product=models.OuterRef("pk"), is_active=True
+        )
+        return self.annotate(
+            min_price=models.Subquery(lines.order_by("price").values("price")[:1]),
+            max_price=models.Subquery(lines.order_by("-price").values("price")[:1]),
+        )
+
+    def with_related(self, fields=None):
+        """
+        Prefetch plan for ProductSerializer.
+
+        Every relation that ProductSerializer touches is loaded up front, so serializing
+        costs one query per relation instead of several queries per product.
+        select_related joins the single-valued foreign keys into the main query,
+        prefetch_related fetches each many-valued relation for all products at once.
+        The price range is computed by the database as well.
+
+        With fields (see serializers.parse_field_selection) only the joins, subqueries
+        and prefetches those fields need are part of the plan.
+        """
+
+        def needed(*names):
+            return fields is None or any(name in fields for name in names)
+
+        queryset = self
+        if needed("min_price", "max_price"):
+            queryset = queryset.with_price_range()
+        # select_related() without arguments would follow every foreign key
+        related = [
+            relation
+            for relation, names in (
+                ("category", ["category_name"]),
+                ("product_type", ["type_specification"]),
+            )
+            if needed(*names)
+        ]
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.prefetch_related(*self.prefetch_lookups(fields))
+
+    @staticmethod
+    def prefetch_lookups(fields=None):
+        # also used on their own, with prefetch_related_objects() (see views.py).
+        # every relation is ordered (lines and images by their order field), so the
+        # output does not depend on the query plan, render.py uses the same orderings.
+        lookups = {
+            "product_line": models.Prefetch(
+                "product_line", queryset=ProductLine.objects.order_by("order")
+            ),
+            "product_line.product_image": models.Prefetch(
+                "product_line__product_image",
+                queryset=ProductImage.objects.order_by("order"),
+            ),
+            "product_line.specification": models.Prefetch(
+                "product_line__attribute_value",
+                queryset=AttributeValue.objects.select_related("attribute").order_by(
+                    "attribute_id"
+                ),
+            ),
+            "type_specification": models.Prefetch(
+                "product_type__attribute", queryset=Attribute.objects.order_by("id")
+            ),
+        }
+        return [
+            lookup
+            for name, lookup in lookups.items()
+            if fields is None or name in fields
+        ]
+
+
+class CleanConstraintsMixin:
+    """
+    Skips the constraints that clean() already checks with a query of its own.
+
+    full_clean() would run the same lookup a second time. All other constraints are
+    still validated, so they show up as a ValidationError (e.g. in the admin) instead
+    of an IntegrityError from the database.
+    """
+
+    # names of the constraints checked by clean()
+    checked_in_clean = ()
+
+    def get_constraints(self):
+        # what Model.validate_constraints goes through
+        return [
+            (
+                model_class,
+                [c for c in constraints if c.name not in self.checked_in_clean],
+            )
+            for model_class, constraints in super().get_constraints()
+        ]
+
+
 # Same thing done with custom manager (but overkill for such a simple task):
 # class ActiveManager(models.Manager):
 #     # this would override the model.objects.all() method:
@@ -25,17 +129,29 @@ class Category(MPTTModel):
     slug = models.SlugField(max_length=100, unique=True)
     parent = TreeForeignKey("self", on_delete=models.PROTECT, null=True, blank=True)
     is_active = models.BooleanField(default=False)
+    # Last-Modified of the category endpoints
+    updated_at = models.DateTimeField(auto_now=True)
     objects = IsActiveQueryset.as_manager()
 
     class MPTTMeta:
         order_insertion_by = ["name"]
 
+    class Meta:
+        # subtree lookups filter on tree_id and a lft range (see views.py).
+        # the name must be given explicitly, since mptt only adds these fields later on.
+        indexes = [
+            models.Index(
+                fields=["tree_id", "lft", "rght"], name="category_tree_range_idx"
+            )
+        ]
+
     def __str__(self):
         return self.name
 
 
 class Product(models.Model):
     name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True)
     pid = models.CharField(max_length=10, unique=True)
     description = models.TextField(blank=True)
     is_digital = models.BooleanField(default=False)
@@ -48,6 +164,11 @@ class Product(models.Model):
         "ProductType", on_delete=models.PROTECT, related_name="product_type"
     )
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    # last change of the product's API output, including its lines, images and
+    # specification: signals.py touches it whenever one of those changes.
+    updated_at = models.DateTimeField(auto_now=True)
+    # last order handed out to a product line of this product (see fields.py)
+    last_line_order = models.PositiveIntegerField(default=0, editable=False)
     attribute_value = models.ManyToManyField(
         "AttributeValue",
         through="ProductAttributeValue",
@@ -57,7 +178,11 @@ class Product(models.Model):
     # the manager runs when calling Product.objects.all() or Product.objects.is_active()
     # default manager would be models.Manager()
     # objects = ActiveManager()
-    objects = IsActiveQueryset.as_manager()
+    objects = ProductQueryset.as_manager()
+
+    class Meta:
+        # keyset pagination of the product listings walks this index.
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return self.name
@@ -77,19 +202,57 @@ class AttributeValue(models.Model):
         Attribute, on_delete=models.CASCADE, related_name="attribute_value"
     )
 
+    attribute_conflict = "A product line of this value already has this attribute."
+
+    def clean(self):
+        # a value can only move to another attribute if none of its product lines
+        # has a value for that attribute already (one value per attribute)
+        if self.pk is not None and self.attribute_id is not None:
+            lines = ProductLineAttributeValue.objects.filter(attribute_value=self)
+            if (
+                ProductLineAttributeValue.objects.filter(
+                    attribute_id=self.attribute_id,
+                    product_line__in=lines.values("product_line"),
+                )
+                .exclude(attribute_value=self)
+                .exists()
+            ):
+                raise ValidationError({"attribute": self.attribute_conflict})
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic(
+            using=router.db_for_write(AttributeValue, instance=self)
+        ):
+            super(AttributeValue, self).save(*args, **kwargs)
+            if adding:
+                return
+            # keep the copy of the attribute in the product line links up to date,
+            # the unique constraint rejects it if clean() was not run before
+            try:
+                self.product_attribute_value_av.exclude(
+                    attribute_id=self.attribute_id
+                ).update(attribute_id=self.attribute_id)
+            except IntegrityError:
+                # leaving the atomic block rolls the save back as well
+                raise ValidationError({"attribute": self.attribute_conflict})
+
     def __str__(self):
         return f"{self.attribute}-{self.attribute_value}"
 
 
-class ProductLine(models.Model):
+class ProductLine(CleanConstraintsMixin, models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    sku = models.CharField(max_length=100)
+    # order and warehouse services look lines up by sku (see skus.py)
+    sku = models.CharField(max_length=100, unique=True)
     stock_qty = models.IntegerField()
     product = models.ForeignKey(
         Product, on_delete=models.PROTECT, related_name="product_line"
     )
     is_active = models.BooleanField(default=False)
-    order = OrderField(unique_for_field="product", blank=True)
+    order = OrderField(
+        unique_for_field="product", counter_field="last_line_order", blank=True
+    )
     weight = models.FloatField()
     attribute_value = models.ManyToManyField(
         AttributeValue,
@@ -100,17 +263,48 @@ class ProductLine(models.Model):
         "ProductType", on_delete=models.PROTECT, related_name="product_line_type"
     )
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    # last order handed out to an image of this product line (see fields.py)
+    last_image_order = models.PositiveIntegerField(default=0, editable=False)
 
     # determines what is returned when model.objects.all() is called:
     objects = IsActiveQueryset.as_manager()
+    checked_in_clean = ["unique_product_line_order"]
+
+    class Meta:
+        constraints = [
+            # also the index for the existence check in clean() and for OrderField.
+            models.UniqueConstraint(
+                fields=["product", "order"], name="unique_product_line_order"
+            )
+        ]
+        # prices only count for active lines, so the price indexes only hold those.
+        # (a plain (is_active, price) index does not help on SQLite, where the
+        # filter is written as "WHERE is_active" and not as an equality on the column)
+        indexes = [
+            # price range filters on all lines (see filters.py)
+            models.Index(
+                fields=["price"],
+                condition=models.Q(is_active=True),
+                name="active_line_price_idx",
+            ),
+            # min/max price of a product (see ProductQueryset.with_price_range)
+            models.Index(
+                fields=["product", "price"],
+                condition=models.Q(is_active=True),
+                name="active_line_product_price_idx",
+            ),
+        ]
 
     # See https://docs.djangoproject.com/en/4.1/ref/models/instances/
     # clean is one step in model validation, where validation needs access to multiple fields.
     def clean(self):
-        qs = ProductLine.objects.filter(product=self.product)
-        # Check for duplicate order values:
-        for obj in qs:
-            if self.id != obj.id and obj.order == self.order:
+        # Check for duplicate order values, a single lookup on the (product, order) index.
+        # a new line without order gets a free one from the OrderField, nothing to check.
+        if self.order is not None:
+            qs = ProductLine.objects.filter(
+                product_id=self.product_id, order=self.order
+            )
+            if qs.exclude(pk=self.pk).exists():
                 raise ValidationError(
                     {"order": "ProductLine with this order already exists."}
                 )
@@ -119,9 +313,59 @@ class ProductLine(models.Model):
 
     # enforce clean to be called whenever an instance is created, even from command line:
     def save(self, *args, **kwargs):
+        # the order constraint is already checked by clean(), no need to query it twice.
         self.full_clean()
         return super(ProductLine, self).save(*args, **kwargs)
 
+    def set_attribute_values(self, attribute_values):
+        """
+        Adds attribute values to the specification of this line, all at once.
+
+        Faster than self.attribute_value.add(), which looks up the attribute of every
+        value on its own and leaves the one-value-per-attribute rule to the database
+        (IntegrityError). Here the rule is checked for the whole set with a single query
+        (ValidationError), values that are already linked are skipped.
+        """
+        attribute_values = list(attribute_values)
+        by_attribute = {}
+        for value in attribute_values:
+            if by_attribute.setdefault(value.attribute_id, value.pk) != value.pk:
+                raise ValidationError(
+                    {"attribute_value": "Only one value per attribute can be set."}
+                )
+        linked = dict(
+            ProductLineAttributeValue.objects.filter(
+                product_line=self, attribute_id__in=by_attribute
+            ).values_list("attribute_id", "attribute_value_id")
+        )
+        if any(linked[a] != pk for a, pk in by_attribute.items() if a in linked):
+            raise ValidationError({"attribute_value": "This attribute already exists."})
+        pk_set = {pk for a, pk in by_attribute.items() if a not in linked}
+        if not pk_set:
+            return
+
+        # bulk_create sends no signals, so the ones of .add() are sent instead.
+        signal = dict(
+            sender=ProductLineAttributeValue,
+            instance=self,
+            reverse=False,
+            model=AttributeValue,
+            pk_set=pk_set,
+            using=router.db_for_write(ProductLineAttributeValue, instance=self),
+        )
+        with transaction.atomic(using=signal["using"]):
+            m2m_changed.send(action="pre_add", **signal)
+            ProductLineAttributeValue.objects.bulk_create(
+                [
+                    ProductLineAttributeValue(
+                        product_line=self, attribute_value_id=pk, attribute_id=a
+                    )
+                    for a, pk in by_attribute.items()
+                    if pk in pk_set
+                ]
+            )
+            m2m_changed.send(action="post_add", **signal)
+
     def __str__(self):
         return str(self.sku)
 
@@ -140,7 +384,7 @@ class ProductAttributeValue(models.Model):
         unique_together = ("product", "attribute_value")
 
 
-class ProductLineAttributeValue(models.Model):
+class ProductLineAttributeValue(CleanConstraintsMixin, models.Model):
     # A table that links a ProductLine to Attributes
     attribute_value = models.ForeignKey(
         AttributeValue,
@@ -150,52 +394,75 @@ class ProductLineAttributeValue(models.Model):
     product_line = models.ForeignKey(
         ProductLine, on_delete=models.CASCADE, related_name="product_attribute_value_pl"
     )
+    # copy of attribute_value.attribute, so the database itself can enforce
+    # the one-value-per-attribute rule of a product line (set in clean(), or on
+    # insert by the field itself, see fields.py).
+    attribute = CopiedForeignKey(
+        Attribute,
+        copy_from="attribute_value",
+        on_delete=models.CASCADE,
+        related_name="product_line_attribute_value_a",
+        editable=False,
+    )
+    checked_in_clean = ["unique_product_line_attribute"]
 
     class Meta:
-        unique_together = ("product_line", "attribute_value")
+        constraints = [
+            # a line can hold only one value per attribute,
+            # which also rules out linking the same value twice.
+            models.UniqueConstraint(
+                fields=["product_line", "attribute"],
+                name="unique_product_line_attribute",
+            )
+        ]
+        # attribute filters look up the lines of a value (see filters.py),
+        # covered by this index without reading the table itself.
+        indexes = [models.Index(fields=["attribute_value", "product_line"])]
 
     def clean(self):
-        # Here, we want to check if duplicate attributes exist
-        # qs returns true (false) if filter finds that new attribute_value
-        # already exists for given product file
-        qs = (
-            ProductLineAttributeValue.objects.filter(
-                attribute_value=self.attribute_value
-            )
-            .filter(product_line=self.product_line)
-            .exists()
+        # Here, we want to check if the product line already has a value for this
+        # attribute. Thanks to the attribute column this is a single lookup on the
+        # (product_line, attribute) index, instead of a walk over the attribute tables.
+        if self.attribute_value_id is None:
+            return
+        self.attribute_id = self.attribute_value.attribute_id
+        qs = ProductLineAttributeValue.objects.filter(
+            product_line_id=self.product_line_id, attribute_id=self.attribute_id
         )
-
-        if not qs:
-            # Here we traverse through two tables using the related_names
-            # to get all attributes associated to a given product_line
-            iqs = Attribute.objects.filter(
-                attribute_value__product_line_attribute_value=self.product_line
-            ).values_list("pk", flat=True)
-
-            if self.attribute_value.attribute.id in list(iqs):
-                raise ValidationError(
-                    {"attribute_value": "This attribute already exists."}
-                )
+        if qs.exclude(pk=self.pk).exists():
+            raise ValidationError({"attribute_value": "This attribute already exists."})
 
     def save(self, *args, **kwargs):
         # again, just make sure clean gets initiated even when using command line.
-        self.full_clean()
+        # attribute is filled in by clean(), the constraint is checked by clean() too.
+        self.full_clean(exclude=["attribute"])
         return super(ProductLineAttributeValue, self).save(*args, **kwargs)
 
 
-class ProductImage(models.Model):
+class ProductImage(CleanConstraintsMixin, models.Model):
     alternative_text = models.CharField(max_length=100)
     url = models.ImageField(upload_to=None, default="test.jpg")
     product_line = models.ForeignKey(
         ProductLine, on_delete=models.CASCADE, related_name="product_image"
     )
-    order = OrderField(unique_for_field="product_line", blank=True)
+    order = OrderField(
+        unique_for_field="product_line", counter_field="last_image_order", blank=True
+    )
+    checked_in_clean = ["unique_product_image_order"]
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product_line", "order"], name="unique_product_image_order"
+            )
+        ]
 
     def clean(self):
-        qs = ProductImage.objects.filter(product_line=self.product_line)
-        for obj in qs:
-            if self.id != obj.id and obj.order == self.order:
+        if self.order is not None:
+            qs = ProductImage.objects.filter(
+                product_line_id=self.product_line_id, order=self.order
+            )
+            if qs.exclude(pk=self.pk).exists():
                 raise ValidationError(
                     {"order": "ProductImage with this order already exists."}
                 )
@@ -234,3 +501,17 @@ class ProductTypeAttribute(models.Model):
         unique_together = ("product_type", "attribute")
         # unique together means, there should be no duplicates where product_type and attribute are both the same.
         # though individually they can appear multiple times.
+
+
+class ProductDocument(models.Model):
+    # Read model: the ProductSerializer output of an active product, stored precomputed
+    # so the product detail endpoint is a single lookup instead of a walk over five tables.
+    # Kept up to date by signals.py, rebuilt with "manage.py rebuild_product_documents".
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="document"
+    )
+    document = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.product_id)
@@ -0,0 +1,215 @@
+import re
+from collections import defaultdict
+from decimal import Decimal
+from functools import lru_cache
+from operator import itemgetter
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+
+from .models import (
+    ProductImage,
+    ProductLine,
+    ProductLineAttributeValue,
+    ProductTypeAttribute,
+)
+
+"""
+Fast path of the product listings (see views.py), turned on with the
+PRODUCT_FAST_RENDER setting.
+
+Once the queries are batched, most of the time of a listing goes into ProductSerializer:
+field lookups, to_representation of every field, the pop/loop/update of the nested
+specifications. render_products builds the same output straight from .values() rows:
+each field is a plain function of the row, chosen once per field selection, and the
+relations are one .values() query each, grouped by their parent in a dict.
+
+The output is the same as ProductSerializer(products, many=True, fields=fields).data,
+down to the order of the keys (test_render.py checks the rendered JSON byte by byte).
+Related rows are sorted like the prefetches of ProductQueryset.prefetch_lookups.
+They are filtered by a join on the product ids of the page, instead of a list of
+every line id (building the SQL for a long IN list is slow in itself). The lookups
+go through product__id__in rather than product__in: the ids are then prepared as plain
+integers, the lookup on the relation checks every one of them for a model instance.
+"""
+
+PRICE = Decimal("0.01")
+# names filepath_to_uri leaves as they are
+PLAIN_NAME = re.compile(r"[\w./~!*()'-]*", re.ASCII)
+
+
+def price(value):
+    # serializers.DecimalField(decimal_places=2), null stays null
+    return None if value is None else "{:f}".format(value.quantize(PRICE))
+
+
+def image_url_extractor():
+    """
+    Function from the name of an image to what serializers.ImageField returns without
+    a request in the context: storage.url(name), None for no image.
+    """
+    # the storage of the field (default_storage, unless the field sets one), so the
+    # urls are the ones of ProductSerializer, whatever the storage backend.
+    # it's a lazy object, every attribute access goes through a proxy
+    storage = ProductImage._meta.get_field("url").storage
+    storage_url = storage.url
+    if storage_url.__func__ is not FileSystemStorage.url:
+        # any other backend, including subclasses with their own url()
+        return lambda name: storage_url(name) if name else None
+    # FileSystemStorage.url runs urljoin, which takes longer than everything else of
+    # an image. Appending gives the same url, unless the name has a dot segment or a
+    # colon (which urljoin could read as a scheme), those still go through the storage.
+    base_url = storage.base_url
+
+    def url(name):
+        if not name:
+            return None
+        path = name if PLAIN_NAME.fullmatch(name) else filepath_to_uri(name)
+        path = path.lstrip("/")
+        if ":" in path or path.startswith(".") or "/." in path:
+            return storage_url(name)
+        return base_url + path
+
+    return url
+
+
+def product_values(fields=None):
+    """
+    Names to pass to .values() for the products, with fields as in render_products.
+
+    id, created_at and updated_at are always there, for the cursor and the ETag.
+    """
+
+    def needed(name):
+        return fields is None or name in fields
+
+    values = ["id", "created_at", "updated_at"]
+    for name, columns in (
+        ("name", ["name"]),
+        ("slug", ["slug"]),
+        ("description", ["description"]),
+        ("category_name", ["category__name"]),
+        ("min_price", ["min_price"]),
+        ("max_price", ["max_price"]),
+        ("type_specification", ["product_type_id"]),
+    ):
+        if needed(name):
+            values += columns
+    return values
+
+
+@lru_cache
+def product_extractors(fields):
+    """
+    (output key, function of the row) of every product field, in ProductSerializer order.
+
+    Relations are read from the row as well, render_products puts them there first.
+    """
+    extractors = [
+        ("name", itemgetter("name")),
+        ("slug", itemgetter("slug")),
+        ("description", itemgetter("description")),
+        ("category_name", itemgetter("category__name")),
+        ("min_price", lambda row: price(row["min_price"])),
+        ("max_price", lambda row: price(row["max_price"])),
+        ("product_line", itemgetter("product_line")),
+        ("type specification", itemgetter("type_specification")),
+    ]
+    return [
+        (key, extractor)
+        for key, extractor in extractors
+        if fields is None or key.replace(" ", "_") in fields
+    ]
+
+
+def render_products(rows, fields=None):
+    """
+    The ProductSerializer output of the products in rows, which are .values() rows with
+    the names of product_values(fields). fields is a set from parse_field_selection.
+
+    One query per selected relation: lines, images, specifications, type attributes.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+
+    def needed(name):
+        return fields is None or name in fields
+
+    if needed("product_line"):
+        lines = render_lines(
+            [row["id"] for row in rows],
+            images=needed("product_line.product_image"),
+            specification=needed("product_line.specification"),
+        )
+        for row in rows:
+            row["product_line"] = lines.get(row["id"], [])
+    if needed("type_specification"):
+        type_attributes = defaultdict(dict)
+        for product_type_id, attribute_id, name in (
+            ProductTypeAttribute.objects.filter(
+                product_type__in={row["product_type_id"] for row in rows}
+            )
+            .order_by("attribute_id")
+            .values_list("product_type_id", "attribute_id", "attribute__name")
+        ):
+            type_attributes[product_type_id][attribute_id] = name
+        for row in rows:
+            row["type_specification"] = type_attributes[row["product_type_id"]]
+
+    extractors = product_extractors(None if fields is None else frozenset(fields))
+    return [{key: extractor(row) for key, extractor in extractors} for row in rows]
+
+
+def render_lines(product_ids, images=True, specification=True):
+    """
+    The ProductLineSerializer output of the lines of the given products, by product id.
+    """
+    lines = list(
+        ProductLine.objects.filter(product__id__in=product_ids)
+        .order_by("order")
+        .values_list("id", "product_id", "price", "sku", "stock_qty", "order")
+    )
+    # like prefetch_related, the nested relations are not queried without any line
+    line_images = defaultdict(list)
+    if images and lines:
+        image_url = image_url_extractor()
+        for line_id, alternative_text, url, order in (
+            ProductImage.objects.filter(product_line__product__id__in=product_ids)
+            .order_by("order")
+            .values_list("product_line_id", "alternative_text", "url", "order")
+        ):
+            line_images[line_id].append(
+                {
+                    "alternative_text": alternative_text,
+                    "url": image_url(url),
+                    "order": order,
+                }
+            )
+    line_specifications = defaultdict(dict)
+    if specification and lines:
+        for line_id, attribute_id, value in (
+            ProductLineAttributeValue.objects.filter(
+                product_line__product__id__in=product_ids
+            )
+            .order_by("attribute_id")
+            .values_list(
+                "product_line_id", "attribute_id", "attribute_value__attribute_value"
+            )
+        ):
+            line_specifications[line_id][attribute_id] = value
+
+    products = defaultdict(list)
+    for line_id, product_id, line_price, sku, stock_qty, order in lines:
+        line = {
+            "price": price(line_price),
+            "sku": sku,
+            "stock_qty": stock_qty,
+            "order": order,
+        }
+        if images:
+            line["product_image"] = line_images[line_id]
+        if specification:
+            line["specification"] = line_specifications[line_id]
+        products[product_id].append(line)
+    return products
@@ -0,0 +1,256 @@
+import re
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils.module_loading import import_string
+
+from drfecommerce.db import query_chunks
+
+from .models import Product, ProductAttributeValue, ProductLineAttributeValue
+
+"""
+Full-text search over the active products, used by the product "search" endpoint.
+
+Every product has one row in the product_search table (created by migration 0010),
+holding its name, category name, attribute values and description. The backend is
+picked by database vendor, or set with the PRODUCT_SEARCH_BACKEND setting (dotted path):
+- SQLite: an FTS5 virtual table, ranked with bm25
+  See: https://www.sqlite.org/fts5.html
+- PostgreSQL: a tsvector column with a GIN index, ranked with ts_rank
+  See: https://www.postgresql.org/docs/current/textsearch-controls.html
+- any other database: no table, icontains lookups on the product tables
+  (BasicSearchBackend, slow on big catalogs)
+The table is queried on the database the router picks for Product (a replica when
+reading, see db.py), like the product tables it is built from.
+
+Rows are kept up to date by signals.py (index_products runs together with the document
+refresh), "manage.py rebuild_search_index" fills the table from scratch.
+"""
+
+SEARCH_TABLE = "product_search"
+# matches are weighted by the column they are found in
+NAME, CATEGORY, ATTRIBUTES, DESCRIPTION = 10.0, 4.0, 3.0, 1.0
+
+
+def search_terms(query):
+    # only words are kept, so user input can never be read as query syntax
+    return re.findall(r"\w+", query.lower())
+
+
+def search_rows(product_ids):
+    """
+    (product id, name, category, attributes, description) of the given active products.
+
+    Three queries for the whole batch.
+    """
+    products = (
+        Product.objects.is_active()
+        .filter(pk__in=product_ids)
+        .values_list("pk", "name", "category__name", "description")
+    )
+    attributes = defaultdict(list)
+    for model, lookup in (
+        (ProductLineAttributeValue, "product_line__product_id"),
+        (ProductAttributeValue, "product_id"),
+    ):
+        values = model.objects.filter(**{f"{lookup}__in": product_ids}).values_list(
+            lookup, "attribute_value__attribute_value"
+        )
+        for product_id, value in values:
+            attributes[product_id].append(value)
+    return [
+        (pk, name, category or "", " ".join(attributes[pk]), description)
+        for pk, name, category, description in products
+    ]
+
+
+class SearchBackend(ABC):
+    @abstractmethod
+    def index(self, product_ids):
+        """
+        Replaces the rows of the given products, inactive or deleted products are removed.
+        """
+
+    @abstractmethod
+    def search(self, query, limit):
+        """
+        Ids of the best matching products, best match first.
+        """
+
+
+class TableSearchBackend(SearchBackend):
+    # the search table is read and written like the product tables, so the queries go
+    # to the databases the router picks for Product (e.g. a read replica, see db.py)
+
+    def index(self, product_ids):
+        using = router.db_for_write(Product)
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            # the ids are compared with in one query, limited in size on SQLite
+            for chunk in query_chunks(product_ids, using=using):
+                rows = search_rows(chunk)
+                self.delete(cursor, chunk)
+                if rows:
+                    self.insert(cursor, rows)
+
+    def search(self, query, limit):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        with connections[router.db_for_read(Product)].cursor() as cursor:
+            self.match(cursor, terms, limit)
+            return [pk for pk, in cursor.fetchall()]
+
+    @abstractmethod
+    def delete(self, cursor, product_ids):
+        pass
+
+    @abstractmethod
+    def insert(self, cursor, rows):
+        pass
+
+    @abstractmethod
+    def match(self, cursor, terms, limit):
+        """
+        Runs the query selecting the ids of the best matching products.
+        """
+
+
+class BasicSearchBackend(SearchBackend):
+    """
+    For databases without a search table (e.g. MySQL, see migration 0010): every term
+    has to be in one of the columns, with icontains. That scans the products instead of
+    an index, fine for small catalogs. Products with every term in the name come first.
+    """
+
+    def index(self, product_ids):
+        # there is no table to keep up to date
+        pass
+
+    def search(self, query, limit):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        matches = Q()
+        for term in terms:
+            attributes = Q()
+            for model, lookup in (
+                (ProductLineAttributeValue, "product_line__product_id"),
+                (ProductAttributeValue, "product_id"),
+            ):
+                attributes |= Q(
+                    pk__in=model.objects.filter(
+                        attribute_value__attribute_value__icontains=term
+                    ).values(lookup)
+                )
+            matches &= (
+                Q(name__icontains=term)
+                | Q(category__name__icontains=term)
+                | Q(description__icontains=term)
+                | attributes
+            )
+        in_name = Q(*[Q(name__icontains=term) for term in terms])
+        return list(
+            Product.objects.is_active()
+            .filter(matches)
+            .annotate(in_name=ExpressionWrapper(in_name, output_field=BooleanField()))
+            .order_by("-in_name", "pk")
+            .values_list("pk", flat=True)[:limit]
+        )
+
+
+class SQLiteSearchBackend(TableSearchBackend):
+    def delete(self, cursor, product_ids):
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", product_ids
+        )
+
+    def insert(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} "
+            "(rowid, name, category, attributes, description) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+    def match(self, cursor, terms, limit):
+        # every term has to match, as a prefix ("sho" finds "shoes")
+        match = " ".join(f'"{term}"*' for term in terms)
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, %s, %s, %s, %s) LIMIT %s",
+            [match, NAME, CATEGORY, ATTRIBUTES, DESCRIPTION, limit],
+        )
+
+
+class PostgresSearchBackend(TableSearchBackend):
+    # the weights of ts_rank are given per label {D, C, B, A}, and at most 1
+    WEIGHTS = "{%s}" % ", ".join(
+        str(weight / NAME) for weight in (DESCRIPTION, ATTRIBUTES, CATEGORY, NAME)
+    )
+
+    def delete(self, cursor, product_ids):
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE product_id = ANY(%s)", [product_ids]
+        )
+
+    def insert(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (product_id, search_vector) VALUES (%s, "
+            "setweight(to_tsvector('english', %s), 'A') || "
+            "setweight(to_tsvector('english', %s), 'B') || "
+            "setweight(to_tsvector('english', %s), 'C') || "
+            "setweight(to_tsvector('english', %s), 'D'))",
+            rows,
+        )
+
+    def match(self, cursor, terms, limit):
+        match = " & ".join(f"{term}:*" for term in terms)
+        cursor.execute(
+            f"SELECT product_id FROM {SEARCH_TABLE}, "
+            "to_tsquery('english', %s) query WHERE search_vector @@ query "
+            "ORDER BY ts_rank(%s::float4[], search_vector, query) DESC LIMIT %s",
+            [match, self.WEIGHTS, limit],
+        )
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def search_backend():
+    path = settings.PRODUCT_SEARCH_BACKEND
+    if path:
+        return import_string(path)()
+    vendor = connections[router.db_for_read(Product)].vendor
+    return BACKENDS.get(vendor, BasicSearchBackend)()
+
+
+def index_products(product_ids):
+    search_backend().index(product_ids)
+
+
+def rebuild_search_index(batch_size=500):
+    """
+    Indexes all products, batch_size products at a time. Returns the number of products.
+    """
+    product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+    backend = search_backend()
+    for start in range(0, len(product_ids), batch_size):
+        backend.index(product_ids[start : start + batch_size])
+    return len(product_ids)
+
+
+def search_products(query, limit):
+    """
+    The best matching active products, ready for ProductSerializer.
+    """
+    product_ids = search_backend().search(query, limit)
+    products = Product.objects.is_active().with_related().in_bulk(product_ids)
+    # in_bulk loses the ranking, products that were deactivated since are skipped
+    return [products[pk] for pk in product_ids if pk in products]
@@ -10,6 +10,58 @@ from .models import (
 )
 
 
+"""
+Product listings can ask for a subset of the output with ?fields= and ?expand=:
+
+    ?fields=name,category_name,min_price         plain fields, none of the relations
+    ?expand=product_line.product_image           all plain fields, lines with images
+    ?fields=name&expand=type_specification
+
+Relations are only included when they are expanded, product_line alone gives the lines
+without their images and specification. Without either parameter, everything is there.
+The prefetch plan follows the same selection (see ProductQueryset.with_related), so
+relations that are not asked for are not queried at all.
+"""
+
+PRODUCT_FIELDS = [
+    "name",
+    "slug",
+    "description",
+    "category_name",
+    "min_price",
+    "max_price",
+]
+PRODUCT_RELATIONS = [
+    "product_line",
+    "product_line.product_image",
+    "product_line.specification",
+    "type_specification",
+]
+
+
+def parse_field_selection(params):
+    """
+    Turns ?fields= and ?expand= into the set of names to output, None for everything.
+    """
+    if "fields" not in params and "expand" not in params:
+        return None
+
+    def names(param, choices):
+        values = [value for value in params.get(param, "").split(",") if value]
+        for value in values:
+            if value not in choices:
+                raise serializers.ValidationError(
+                    {param: f"'{value}' is not one of {', '.join(choices)}."}
+                )
+        return values
+
+    fields = names("fields", PRODUCT_FIELDS) if "fields" in params else PRODUCT_FIELDS
+    relations = names("expand", PRODUCT_RELATIONS)
+    # a nested relation needs the relation it is nested in
+    parents = [relation.partition(".")[0] for relation in relations]
+    return set(fields) | set(relations) | set(parents)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source="name")
 
@@ -21,7 +73,7 @@ class CategorySerializer(serializers.ModelSerializer):
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
-        exclude = ["id", "productline"]
+        exclude = ["id", "product_line"]
 
 
 class AttributeSerializer(serializers.ModelSerializer):
@@ -57,10 +109,25 @@ class ProductLineSerializer(serializers.ModelSerializer):
             "attribute_value",
         )
 
+    def __init__(self, *args, expand=None, **kwargs):
+        # expand: the nested relations to keep ("product_image", "specification"),
+        # None keeps both
+        super().__init__(*args, **kwargs)
+        if expand is not None:
+            for name, field in (
+                ("product_image", "product_image"),
+                ("specification", "attribute_value"),
+            ):
+                if name not in expand:
+                    self.fields.pop(field)
+
     def to_representation(self, instance):
         # See https://testdriven.io/blog/drf-serializers/ for explanation of the function
         # See Lesson 86 beginning, for before/after view of what we want to do here.
         representation = super().to_representation(instance)
+        if "attribute_value" not in representation:
+            # the specification was not asked for
+            return representation
         # pop() affects the original dictionary, not just a copy
         attr_value_data = representation.pop("attribute_value")
         attr_values_dict = {}
@@ -75,9 +142,19 @@ class ProductLineSerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     # goal: instead of convoluted output category / brand etc., with name keys inside,
     # we just want a property "category_name" in main content. (=Flattening)
-    category_name = serializers.CharField(source="category.name")
+    # null for products without a category (imported without one, or category deleted)
+    category_name = serializers.CharField(
+        source="category.name", allow_null=True, default=None
+    )
     product_line = ProductLineSerializer(many=True)
     attribute = serializers.SerializerMethodField()
+    # annotated by ProductQueryset.with_price_range, null without active product lines
+    min_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
+    max_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
 
     class Meta:
         model = Product
@@ -86,21 +163,55 @@ class ProductSerializer(serializers.ModelSerializer):
             "slug",
             "description",
             "category_name",
+            "min_price",
+            "max_price",
             "product_line",
             "attribute",
         ]
 
+    def __init__(self, *args, fields=None, **kwargs):
+        # fields: the names to output, see parse_field_selection. With many=True this is
+        # passed on to the child serializer, which is the one used for every product.
+        super().__init__(*args, **kwargs)
+        if fields is None:
+            return
+        for name in list(self.fields):
+            if {"attribute": "type_specification"}.get(name, name) not in fields:
+                self.fields.pop(name)
+        if "product_line" in self.fields:
+            self.fields["product_line"] = ProductLineSerializer(
+                many=True,
+                expand={
+                    name.partition(".")[2]
+                    for name in fields
+                    if name.startswith("product_line.")
+                },
+            )
+
     def get_attribute(self, obj):
-        attribute = Attribute.objects.filter(product_type_attribute__product__id=obj.id)
-        return AttributeSerializer(attribute, many=True).data
+        # attribute sets belong to the product type, not the product, so they are only
+        # resolved once per type and request and then reused for all its products.
+        # the map lives in the context, which is shared by all items of a list.
+        type_attributes = self.context.setdefault("type_attributes", {})
+        if obj.product_type_id not in type_attributes:
+            type_attributes[obj.product_type_id] = {
+                attribute.id: attribute.name
+                for attribute in obj.product_type.attribute.all()
+            }
+        return type_attributes[obj.product_type_id]
 
     def to_representation(self, instance):
         # Best to first run query on swagger with this function
         # commented/uncommented, to see effect.
         representation = super().to_representation(instance)
-        type_spec_data = representation.pop("attribute")
-        type_spec_dict = {}
-        for key in type_spec_data:
-            type_spec_dict.update({key["id"]: key["name"]})
-        representation.update({"type specification": type_spec_dict})
+        if "attribute" in representation:
+            type_spec_dict = representation.pop("attribute")
+            representation.update({"type specification": type_spec_dict})
         return representation
+
+
+class SkuResolveSerializer(serializers.Serializer):
+    # request body of the productline "resolve" endpoint
+    skus = serializers.ListField(
+        child=serializers.CharField(max_length=100), allow_empty=False, max_length=5000
+    )
@@ -0,0 +1,251 @@
+from django.db import router, transaction
+from django.db.models import Q
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from mptt.signals import node_moved
+
+from drfecommerce.db import query_chunks
+
+from .cache import (
+    invalidate_category_tree,
+    invalidate_facet_index,
+    invalidate_products,
+)
+from .documents import refresh_product_documents
+from .models import (
+    Attribute,
+    AttributeValue,
+    Category,
+    Product,
+    ProductAttributeValue,
+    ProductImage,
+    ProductLine,
+    ProductLineAttributeValue,
+    ProductType,
+    ProductTypeAttribute,
+)
+from .search import index_products
+
+"""
+See: https://docs.djangoproject.com/en/4.1/topics/signals/
+The receivers are connected in apps.py (ProductConfig.ready).
+
+Every change is traced back to the products whose ProductSerializer output it affects.
+Their documents and search rows are recomputed and their cached responses invalidated
+once the transaction commits, otherwise a concurrent request could rebuild a cache entry
+from the old rows and store it under the new version.
+"""
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+def category_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
+
+
+def product_chunks(product_ids):
+    # renaming a category or an attribute can change tens of thousands of products,
+    # more ids than SQLite takes in one query. refresh_product_documents compares with
+    # two lists of them in one query.
+    return query_chunks(
+        sorted(product_ids), lists=2, using=router.db_for_write(Product)
+    )
+
+
+def products_changed(product_ids, documents=True):
+    # evaluated right away, the rows pointing to the products may be gone after commit
+    product_ids = set(product_ids)
+
+    def refresh():
+        for chunk in product_chunks(product_ids):
+            # the output of the products changed, so does their Last-Modified (and ETag)
+            Product.objects.filter(pk__in=chunk).update(updated_at=timezone.now())
+            # documents=False leaves the documents to rebuild_product_documents
+            # (see import_catalog --skip-documents), everything else is still refreshed
+            if documents:
+                refresh_product_documents(chunk)
+            index_products(chunk)
+            invalidate_products(chunk)
+        invalidate_facet_index()
+
+    if product_ids:
+        transaction.on_commit(refresh)
+
+
+def products_stock_changed(product_ids):
+    """
+    Like products_changed, when only the stock of the products changed (see stock.py).
+
+    updated_at is bumped, so the ETag of listings and the Last-Modified of details
+    change with the stock shown in them, the documents (which show stock_qty) are
+    recomputed and the cached responses invalidated. The search index and the facet
+    index don't depend on the stock and are left alone, so a busy checkout doesn't
+    rebuild either of them.
+    """
+    product_ids = set(product_ids)
+
+    def refresh():
+        for chunk in product_chunks(product_ids):
+            Product.objects.filter(pk__in=chunk).update(updated_at=timezone.now())
+            refresh_product_documents(chunk)
+            invalidate_products(chunk)
+
+    if product_ids:
+        transaction.on_commit(refresh)
+
+
+def product_line_product_ids(product_line_ids):
+    return ProductLine.objects.filter(pk__in=product_line_ids).values_list(
+        "product_id", flat=True
+    )
+
+
+def products_where(**lookups):
+    return Product.objects.filter(**lookups).values_list("pk", flat=True)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    products_changed([instance.pk])
+
+
+@receiver(post_save, sender=ProductLine)
+@receiver(post_delete, sender=ProductLine)
+@receiver(post_save, sender=ProductAttributeValue)
+@receiver(post_delete, sender=ProductAttributeValue)
+def product_row_changed(sender, instance, **kwargs):
+    products_changed([instance.product_id])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductLineAttributeValue)
+@receiver(post_delete, sender=ProductLineAttributeValue)
+def product_line_row_changed(sender, instance, **kwargs):
+    products_changed(product_line_product_ids([instance.product_line_id]))
+
+
+# the parent of the rows whose receivers above only refresh the current parent
+PARENT_FIELDS = {
+    ProductLine: "product_id",
+    ProductAttributeValue: "product_id",
+    ProductImage: "product_line_id",
+    ProductLineAttributeValue: "product_line_id",
+    ProductTypeAttribute: "product_type_id",
+}
+
+
+def parent_product_ids(sender, parent_id):
+    field = PARENT_FIELDS[sender]
+    if field == "product_id":
+        return [parent_id]
+    if field == "product_line_id":
+        return product_line_product_ids([parent_id])
+    return products_where(product_type_id=parent_id)
+
+
+@receiver(pre_save, sender=ProductLine)
+@receiver(pre_save, sender=ProductAttributeValue)
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=ProductLineAttributeValue)
+@receiver(pre_save, sender=ProductTypeAttribute)
+def row_saving(sender, instance, raw=False, **kwargs):
+    # a row can move to another parent (line.product = other), the products of the old
+    # parent change as well. Read from the database, the instance can't tell.
+    if not raw and not instance._state.adding:
+        instance._previous_parent_id = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list(PARENT_FIELDS[sender], flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=ProductLine)
+@receiver(post_save, sender=ProductAttributeValue)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=ProductLineAttributeValue)
+@receiver(post_save, sender=ProductTypeAttribute)
+def row_moved(sender, instance, **kwargs):
+    previous = instance.__dict__.pop("_previous_parent_id", None)
+    if previous is not None and previous != getattr(instance, PARENT_FIELDS[sender]):
+        products_changed(parent_product_ids(sender, previous))
+
+
+@receiver(m2m_changed, sender=ProductLine.attribute_value.through)
+@receiver(m2m_changed, sender=Product.attribute_value.through)
+def attribute_value_link_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # .add()/.remove()/.clear() on the many-to-many fields bypass post_save/post_delete
+    # of the link tables, so they are caught here.
+    by_product = sender is Product.attribute_value.through
+    if not reverse:
+        if action.startswith("post_"):
+            products_changed([instance.pk if by_product else instance.product_id])
+    elif action == "pre_clear":
+        # instance is the AttributeValue, collect its products before the links are gone
+        if by_product:
+            products_changed(products_where(attribute_value=instance))
+        else:
+            products_changed(products_where(product_line__attribute_value=instance))
+    elif action in ("post_add", "post_remove"):
+        products_changed(pk_set if by_product else product_line_product_ids(pk_set))
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def category_row_changed(sender, instance, created=False, **kwargs):
+    # pre_delete, since the products are detached (SET_NULL) before post_delete
+    if not created:
+        products_changed(products_where(category=instance))
+
+
+@receiver(post_save, sender=ProductType)
+def product_type_changed(sender, instance, created, **kwargs):
+    if not created:
+        products_changed(products_where(product_type=instance))
+
+
+@receiver(post_save, sender=ProductTypeAttribute)
+@receiver(post_delete, sender=ProductTypeAttribute)
+def product_type_attribute_changed(sender, instance, **kwargs):
+    products_changed(products_where(product_type_id=instance.product_type_id))
+
+
+@receiver(m2m_changed, sender=ProductType.attribute.through)
+def product_type_attribute_link_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if not reverse:
+        if action.startswith("post_"):
+            products_changed(products_where(product_type=instance))
+    elif action == "pre_clear":
+        products_changed(products_where(product_type__attribute=instance))
+    elif action in ("post_add", "post_remove"):
+        products_changed(products_where(product_type__in=pk_set))
+
+
+@receiver(post_save, sender=Attribute)
+def attribute_changed(sender, instance, created, **kwargs):
+    # deletes cascade to the link tables, whose receivers above take care of them.
+    # new rows are not used by any product yet.
+    if not created:
+        products_changed(
+            Product.objects.filter(
+                Q(product_type__attribute=instance)
+                | Q(product_line__attribute_value__attribute=instance)
+            ).values_list("pk", flat=True)
+        )
+
+
+@receiver(post_save, sender=AttributeValue)
+def attribute_value_changed(sender, instance, created, **kwargs):
+    if not created:
+        products_changed(products_where(product_line__attribute_value=instance))
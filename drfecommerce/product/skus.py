@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from drfecommerce.db import query_chunks
+
+from .models import ProductLine
+
+"""
+Bulk SKU resolution for the order and warehouse services (see ProductLineViewSet).
+
+SKUs are looked up with IN queries on the unique sku index. SQLite limits the number of
+parameters of a query, so long lists are split into chunks of that size.
+
+Optionally, frequently resolved SKUs are kept in a small LRU cache in the memory of each
+process for SKU_CACHE_TIMEOUT seconds (SKU_CACHE_SIZE entries, off with the default 0).
+Within that time a changed price or stock can be served stale, so it is for services
+that can live with that; reserving stock goes through stock.py, which always reads the
+database.
+"""
+
+SKU_FIELDS = ("sku", "product_id", "price", "stock_qty")
+
+
+class LRUCache:
+    """
+    A dict that holds at most size entries, each for timeout seconds.
+
+    The least recently used entry is evicted when it is full.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        # requests are served by several threads of the same process
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                expires, value = entry
+                if expires < now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, values):
+        if not self.size:
+            return
+        expires = time.monotonic() + self.timeout
+        with self.lock:
+            for key, value in values.items():
+                self.entries[key] = (expires, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+sku_cache = LRUCache(settings.SKU_CACHE_SIZE, settings.SKU_CACHE_TIMEOUT)
+
+
+def resolve_skus(skus):
+    """
+    {sku: {"product_id", "price", "stock_qty"}} of the given SKUs, unknown SKUs are left out.
+
+    One query per chunk of SKUs that are not in the cache.
+    """
+    skus = list(dict.fromkeys(skus))
+    found = sku_cache.get_many(skus)
+    missing = [sku for sku in skus if sku not in found]
+    loaded = {}
+    for chunk in query_chunks(missing):
+        rows = ProductLine.objects.filter(sku__in=chunk).values_list(*SKU_FIELDS)
+        for sku, product_id, price, stock_qty in rows:
+            loaded[sku] = {
+                "product_id": product_id,
+                # decimals are shown as strings, like in the serializers
+                "price": str(price),
+                "stock_qty": stock_qty,
+            }
+    sku_cache.set_many(loaded)
+    found.update(loaded)
+    return found
@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models import F
+
+from .models import ProductLine
+from .signals import products_stock_changed
+
+"""
+Stock reservation for checkouts.
+
+Reading stock_qty, changing it and calling save() loses updates when two requests do it
+at the same time (both read the same quantity), and save() runs full_clean() as well.
+Here every line is a single conditional UPDATE:
+
+    UPDATE product_productline SET stock_qty = stock_qty - n
+    WHERE sku = ... AND is_active AND stock_qty >= n
+
+The database checks and decrements in one step, under the row lock, so the stock can
+never be oversold and nothing is loaded into model instances. The number of updated rows
+tells whether the reservation succeeded.
+"""
+
+
+def check_quantities(quantities):
+    for sku, quantity in quantities.items():
+        if not isinstance(quantity, int) or quantity < 1:
+            raise ValueError(f"Quantity of '{sku}' must be a positive integer.")
+
+
+def reserve_stock(quantities, partial=False):
+    """
+    Takes {sku: quantity} off the stock of active product lines, in one transaction.
+
+    Returns {sku: True/False}, False for unknown or inactive SKUs and insufficient stock.
+    By default a batch is all or nothing: if any SKU fails, none is reserved (the result
+    still tells which ones failed). With partial=True the available SKUs are reserved.
+    """
+    check_quantities(quantities)
+    results = {}
+    with transaction.atomic():
+        # always lock the rows in the same order, so two batches can not deadlock
+        for sku in sorted(quantities):
+            quantity = quantities[sku]
+            results[sku] = bool(
+                ProductLine.objects.filter(
+                    sku=sku, is_active=True, stock_qty__gte=quantity
+                ).update(stock_qty=F("stock_qty") - quantity)
+            )
+        if not partial and not all(results.values()):
+            transaction.set_rollback(True)
+            return results
+        stock_changed([sku for sku, reserved in results.items() if reserved])
+    return results
+
+
+def release_stock(quantities):
+    """
+    Puts {sku: quantity} back into stock (cancelled or expired reservations).
+
+    Returns {sku: True/False}, False for unknown SKUs.
+    """
+    check_quantities(quantities)
+    results = {}
+    with transaction.atomic():
+        for sku in sorted(quantities):
+            results[sku] = bool(
+                ProductLine.objects.filter(sku=sku).update(
+                    stock_qty=F("stock_qty") + quantities[sku]
+                )
+            )
+        stock_changed([sku for sku, released in results.items() if released])
+    return results
+
+
+def stock_changed(skus):
+    # update() sends no signals, the stock shown by the product documents and cached
+    # responses is refreshed here (after commit, outside of the row locks).
+    if skus:
+        products_stock_changed(
+            ProductLine.objects.filter(sku__in=skus).values_list(
+                "product_id", flat=True
+            )
+        )
@@ -1,31 +1,200 @@
 # from django.shortcuts import render
-from django.db.models import Prefetch
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max, Subquery, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from drf_spectacular.utils import extend_schema
-from rest_framework import viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
-from .models import Category, Product
-from .serializers import CategorySerializer, ProductSerializer
+from drfecommerce.db import primary_reads
+
+from .cache import (
+    get_cached_product,
+    get_category_tree,
+    product_cache_stats,
+    set_cached_product,
+)
+from .export import EXPORT_FORMATS, export_products
+from .filters import (
+    attribute_facets,
+    filter_by_lines,
+    parse_attribute_filters,
+    parse_line_filters,
+)
+from .models import Category, Product, ProductDocument, ProductLine, ProductQueryset
+from .pagination import ProductCursorPagination
+from .render import product_values, render_products
+from .search import search_products
+from .serializers import (
+    CategorySerializer,
+    ProductSerializer,
+    SkuResolveSerializer,
+    parse_field_selection,
+)
+from .skus import resolve_skus
 
 """
 See: https://www.django-rest-framework.org/api-guide/viewsets/
 instead of defining what happens for get / post request etc. , we specify actions, such as "list"
 also works together with router to automatically create endpoints.
+
+See: https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+GET endpoints send an ETag computed from cheap values (updated_at, ids, cache entries).
+A client sending it back with If-None-Match gets 304 Not Modified, before anything is
+serialized. Product details also send Last-Modified (for If-Modified-Since); lists
+don't, a deleted row would not move the newest updated_at.
 """
 
 
+def conditional_headers(request, etag, last_modified=None):
+    """
+    ETag (and Last-Modified) headers, and whether the client is up to date.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    headers = {"ETag": etag}
+    if timestamp is not None:
+        headers["Last-Modified"] = http_date(timestamp)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    return headers, not_modified is not None
+
+
+def conditional_response(request, data, etag, last_modified=None):
+    """
+    Response with ETag (and Last-Modified) headers, or 304 if the client is up to date.
+
+    data can be a callable, it is only called if the body is actually needed.
+    """
+    headers, not_modified = conditional_headers(request, etag, last_modified)
+    if not_modified:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data() if callable(data) else data, headers=headers)
+
+
+def version_etag(*parts):
+    # weak, since it identifies the version of the data, not the exact bytes
+    content = "|".join(str(part) for part in parts).encode()
+    return "W/" + quote_etag(hashlib.md5(content).hexdigest())
+
+
+def product_documents(slug):
+    # the precomputed document, if there is one, is a single indexed lookup
+    return ProductDocument.objects.filter(
+        product__slug=slug, product__is_active=True
+    ).values_list("product_id", "product__updated_at", "document")
+
+
+def document_detail(documents):
+    """
+    (product ids, data, last modified) of a product detail, from product_documents rows.
+    """
+    product_ids = [product_id for product_id, _, _ in documents]
+    last_modified = max(updated_at for _, updated_at, _ in documents)
+    return product_ids, [document for _, _, document in documents], last_modified
+
+
+def serialize_detail(queryset):
+    """
+    (product ids, data, last modified) of a product detail, serialized on the fly.
+    """
+    products = list(queryset)
+    product_ids = [product.pk for product in products]
+    last_modified = max((product.updated_at for product in products), default=None)
+    return product_ids, ProductSerializer(products, many=True).data, last_modified
+
+
+def product_listing(request, queryset, paginator, view=None):
+    """
+    (etag, data) of a page of products, data is a callable building the body.
+
+    With ?facets the etag is None, the facet counts are not covered by it.
+    """
+    # ?attr=<attribute_id>:<value>, ?min_price, ?max_price and ?in_stock filter by
+    # product line (see filters.py), ?sort=price is handled by the paginator.
+    # with ?facets=true the counts per attribute value of all results are added.
+    # ?fields= and ?expand= pick the output and the prefetch plan (see serializers.py)
+    params = request.query_params
+    fields = parse_field_selection(params)
+    queryset = filter_by_lines(
+        queryset,
+        parse_attribute_filters(params.getlist("attr")),
+        parse_line_filters(params),
+    ).with_related(fields)
+    # only the current page is fetched from the database, without its lines etc.:
+    # if the client already has that page (same products, none of them updated)
+    # the answer is a 304 and the prefetching and serializing are skipped.
+    # with PRODUCT_FAST_RENDER the page is a list of .values() rows (see render.py)
+    fast = settings.PRODUCT_FAST_RENDER
+    page_queryset = queryset.prefetch_related(None)
+    if fast:
+        page_queryset = page_queryset.values(*product_values(fields))
+    page = paginator.paginate_queryset(page_queryset, request, view=view)
+    facets = params.get("facets") in ("true", "1")
+
+    def data():
+        if fast:
+            results = render_products(page, fields)
+        else:
+            prefetch_related_objects(page, *ProductQueryset.prefetch_lookups(fields))
+            results = ProductSerializer(page, many=True, fields=fields).data
+        response = paginator.get_paginated_response(results)
+        if facets:
+            # the counts cover all results, not only the products on this page
+            response.data["facets"] = attribute_facets(queryset)
+        return response.data
+
+    if facets:
+        return None, data
+    etag = version_etag(
+        request.get_full_path(),
+        paginator.get_next_link(),
+        paginator.get_previous_link(),
+        *(
+            (row["id"], row["updated_at"]) if fast else (row.pk, row.updated_at)
+            for row in page
+        ),
+    )
+    return etag, data
+
+
 class CategoryViewSet(viewsets.ViewSet):
     """
     A simple viewset for viewing categories
     """
 
     queryset = Category.objects.all()
+    # reads can go to a replica (see drfecommerce/db.py)
+    read_replica = True
+    # most queries per request (see drfecommerce/middleware.py)
+    query_budgets = {"list": 2, "tree": 1}
 
     @extend_schema(responses=(CategorySerializer))
     def list(self, request):
-        serializer = CategorySerializer(self.queryset, many=True)
-        return Response(serializer.data)
+        # .all() so every request runs its own query, instead of reusing the results
+        # cached on the class level queryset
+        queryset = self.queryset.all()
+        # one aggregate query, the count catches deleted categories
+        stats = queryset.aggregate(last_modified=Max("updated_at"), count=Count("id"))
+        return conditional_response(
+            request,
+            lambda: CategorySerializer(queryset, many=True).data,
+            version_etag(stats["last_modified"], stats["count"]),
+        )
+
+    @action(methods=["get"], detail=False)
+    def tree(self, request):
+        """
+        An endpoint to return all categories as a nested tree (for navigation menus)
+
+        Served from the cache, and with 304 Not Modified if the client already has it.
+        """
+        tree = get_category_tree()
+        return conditional_response(request, tree["data"], tree["etag"])
 
 
 class ProductViewSet(viewsets.ViewSet):
@@ -34,30 +203,139 @@ class ProductViewSet(viewsets.ViewSet):
     """
 
     queryset = Product.objects.is_active()
+    read_replica = True
+    # listings: the page, 4 relations, and with ?facets the product ids and the
+    # rebuild of the facet index. retrieve: when the document is missing.
+    query_budgets = {
+        "list": 7,
+        "list_product_by_category_slug": 7,
+        "retrieve": 6,
+        "search": 6,
+        "cache_stats": 2,
+    }
     lookup_field = "slug"
+    pagination_class = ProductCursorPagination
+
+    def get_queryset(self, fields=None):
+        # shared prefetch plan of all product endpoints, see ProductQueryset.with_related
+        return self.queryset.with_related(fields)
 
     def retrieve(self, request, slug=None):
-        queryset = self.queryset.filter(slug=slug)
-        # select_related is just a tool to reduce the number of db queries
-        serializer = ProductSerializer(
-            queryset.select_related("category", "brand")
-            .prefetch_related(Prefetch("product_line__product_image"))
-            .prefetch_related(Prefetch("product_line__attribute_value__attribute")),
-            many=True,
+        entry = get_cached_product(slug)
+        if entry is None:
+            # cached until the next change, so not from a replica that may lag behind
+            with primary_reads():
+                documents = list(product_documents(slug))
+                if documents:
+                    product_ids, data, last_modified = document_detail(documents)
+                else:
+                    # not built yet (see rebuild_product_documents), serialize on the fly
+                    product_ids, data, last_modified = serialize_detail(
+                        self.get_queryset().filter(slug=slug)
+                    )
+            if not product_ids:
+                # unknown slugs are not cached, the product could be created any time
+                return Response(data)
+            entry = set_cached_product(slug, product_ids, data, last_modified)
+        return conditional_response(
+            request, entry["data"], entry["etag"], entry["last_modified"]
         )
-        return Response(serializer.data)
+
+    @action(methods=["get"], detail=False)
+    def search(self, request):
+        """
+        An endpoint to search products by name, category, specification and description
+
+        ?q=red shoe returns the best matches first, up to ?page_size (default 20).
+        """
+        paginator = self.pagination_class()
+        limit = paginator.get_page_size(request)
+        products = search_products(request.query_params.get("q", ""), limit)
+        serializer = ProductSerializer(products, many=True)
+        return Response({"results": serializer.data})
+
+    @action(methods=["get"], detail=False, permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """
+        Hit and miss counters of the product detail cache (for monitoring)
+        """
+        return Response(product_cache_stats())
+
+    @action(methods=["get"], detail=False)
+    def export(self, request):
+        """
+        Streams the whole catalog, as NDJSON (default) or CSV with ?output=csv (for feeds)
+
+        The response is written while the products are read, chunk by chunk.
+        """
+        output = request.query_params.get("output", "ndjson")
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {"output": f"Choose one of {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        lines, content_type = EXPORT_FORMATS[output]
+        return StreamingHttpResponse(
+            lines(export_products(self.queryset)),
+            content_type=content_type,
+            headers={"Content-Disposition": f'attachment; filename="catalog.{output}"'},
+        )
+
+    def paginated_response(self, queryset):
+        etag, data = product_listing(
+            self.request, queryset, self.pagination_class(), view=self
+        )
+        if etag is None:
+            return Response(data())
+        return conditional_response(self.request, data, etag)
 
     @extend_schema(responses=(ProductSerializer))
     def list(self, request):
-        serializer = ProductSerializer(self.queryset, many=True)
-        return Response(serializer.data)
+        return self.paginated_response(self.queryset)
 
     @action(methods=["get"], detail=False, url_path=r"category/(?P<slug>[\w-]+)/all")
     def list_product_by_category_slug(self, request, slug=None):
         """
         An endpoint to return products by category
+
+        With ?include_descendants=true, products of all subcategories are included too.
         """
-        serializer = ProductSerializer(
-            self.queryset.filter(category__slug=slug), many=True
-        )
-        return Response(serializer.data)
+        queryset = self.queryset
+        if request.query_params.get("include_descendants") in ("true", "1"):
+            # MPTT stores each subtree as a contiguous lft..rght range within its tree,
+            # so the whole subtree is a single range predicate on the category join.
+            # The root's bounds are resolved in subqueries, keeping it to one query.
+            root = Category.objects.filter(slug=slug)
+            queryset = queryset.filter(
+                category__tree_id=Subquery(root.values("tree_id")),
+                category__lft__gte=Subquery(root.values("lft")),
+                category__lft__lte=Subquery(root.values("rght")),
+            )
+        else:
+            queryset = queryset.filter(category__slug=slug)
+        return self.paginated_response(queryset)
+
+
+class ProductLineViewSet(viewsets.ViewSet):
+    """
+    Product line lookups for the order and warehouse services
+    """
+
+    queryset = ProductLine.objects.all()
+    # 5000 skus are 6 chunks where a query takes at most 999 parameters (SQLite)
+    query_budgets = {"resolve": 6}
+
+    @extend_schema(request=SkuResolveSerializer)
+    @action(methods=["post"], detail=False)
+    def resolve(self, request):
+        """
+        Price, stock and product id of up to 5000 SKUs, {"skus": [...]}
+
+        Unknown SKUs are listed under "missing".
+        """
+        serializer = SkuResolveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        skus = serializer.validated_data["skus"]
+        results = resolve_skus(skus)
+        missing = [sku for sku in dict.fromkeys(skus) if sku not in results]
+        return Response({"results": results, "missing": missing})
@@ -33,6 +33,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so it sees the queries of all other middleware too
+    "drfecommerce.middleware.QueryBudgetMiddleware",
+    "drfecommerce.middleware.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -104,6 +107,60 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# cache (alias in CACHES) and lifetime in seconds of the product detail responses
+PRODUCT_CACHE_ALIAS = "default"
+PRODUCT_CACHE_TIMEOUT = 60 * 60
+
+# product search backend (dotted path), None picks it by database vendor
+# see product/search.py
+PRODUCT_SEARCH_BACKEND = None
+
+# build the product listings from .values() rows instead of ProductSerializer
+# (same output, see product/render.py), off by default
+PRODUCT_FAST_RENDER = False
+
+# optional in-process cache of resolved skus: number of entries (0, the default,
+# turns it off) and seconds, within which stock and prices can be served stale
+SKU_CACHE_SIZE = 0
+SKU_CACHE_TIMEOUT = 5
+
+# query budgets (see drfecommerce/middleware.py): budget of views that set none
+# (None: no limit), whether exceeding it raises instead of logging a warning, and
+# whether query count and time are sent in a Server-Timing header (to anyone, so
+# only turned on in local.py)
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_STRICT = False
+SERVER_TIMING = False
+
+# read replicas (see drfecommerce/db.py): aliases in DATABASES catalog reads can go to
+# (set from DATABASE_REPLICA_URLS in local.py and production.py), and for how many
+# seconds a client that wrote keeps reading from the primary
+DATABASE_ROUTERS = ["drfecommerce.db.ReplicaRouter"]
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_PIN_SECONDS = 10
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # INFO logs the queries of every request (local.py), WARNING only the
+        # requests over their query budget
+        "drfecommerce.queries": {"handlers": ["console"], "level": "WARNING"},
+    },
+}
+
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
@@ -1,8 +1,18 @@
+import os
+
+from drfecommerce.db import database_config, replica_configs
+
 from .base import *
 
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    # WAL mode and busy timeout, see drfecommerce/db.py
+    "default": database_config(f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
+    # e.g. DATABASE_REPLICA_URLS=sqlite:////absolute/path/replica.sqlite3
+    **replica_configs(os.environ.get("DATABASE_REPLICA_URLS", "")),
 }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+
+# query count and time of every request, in a Server-Timing header and the console
+# (see drfecommerce/middleware.py)
+SERVER_TIMING = True
+LOGGING["loggers"]["drfecommerce.queries"]["level"] = "INFO"
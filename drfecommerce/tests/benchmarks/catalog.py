@@ -0,0 +1,222 @@
+import random
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from drfecommerce.product.models import (
+    Attribute,
+    AttributeValue,
+    Category,
+    Product,
+    ProductImage,
+    ProductLine,
+    ProductLineAttributeValue,
+    ProductType,
+    ProductTypeAttribute,
+)
+
+"""
+Synthetic catalogs for the benchmarks, written with bulk inserts.
+
+The same size and seed always give the same catalog:
+- a category tree of depth 3 (8 roots, 5 children each, 5 grandchildren each)
+- 12 product types, each with 2 to 4 of the attributes (color, size, ...)
+- products in random categories, with 1 to 4 lines, 1 to 3 images per line and one
+  value for every attribute of the type on each line. 95% of the products and 90% of
+  the lines are active.
+
+The tree fields of the categories are filled in by mptt's rebuild(). The order fields
+and their counters are set right away: bulk_create calls OrderField.pre_save for every
+row, which would allocate the missing orders from the counters one row at a time.
+"""
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+ATTRIBUTES = {
+    "color": ["red", "blue", "green", "black", "white", "grey", "yellow", "pink"],
+    "size": ["XS", "S", "M", "L", "XL", "XXL"],
+    "material": ["cotton", "wool", "leather", "polyester", "linen", "silk"],
+    "fit": ["slim", "regular", "loose"],
+    "brand": [f"brand{n}" for n in range(40)],
+}
+
+
+def parse_scales(value):
+    """
+    Turns "1k,100k" (or plain numbers) into [(label, number of products)].
+    """
+    scales = []
+    for label in value.lower().split(","):
+        label = label.strip()
+        if label:
+            scales.append((label, SCALES.get(label) or int(label)))
+    return scales
+
+
+def words(size, rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choices(letters, k=rng.randint(4, 9))) for _ in range(size)]
+
+
+@dataclass
+class Catalog:
+    size: int
+    vocabulary: list
+    category_slugs: list = field(default_factory=list)
+    skus: list = field(default_factory=list)
+    attribute_values: dict = field(default_factory=dict)
+    seconds: float = 0
+
+
+def create_categories(roots=8, children=5, depth=3):
+    level = Category.objects.bulk_create(
+        [
+            Category(name=f"c{n}", slug=f"c{n}", lft=0, rght=0, tree_id=0, level=0)
+            for n in range(roots)
+        ]
+    )
+    categories = list(level)
+    for _ in range(depth - 1):
+        level = Category.objects.bulk_create(
+            [
+                Category(
+                    name=f"{parent.name}-{n}",
+                    slug=f"{parent.slug}-{n}",
+                    parent=parent,
+                    lft=0,
+                    rght=0,
+                    tree_id=0,
+                    level=0,
+                )
+                for parent in level
+                for n in range(children)
+            ]
+        )
+        categories += level
+    # objects is not a TreeManager here, mptt keeps its own one
+    Category._tree_manager.rebuild()
+    return categories
+
+
+def create_product_types(rng, types=12):
+    attributes = Attribute.objects.bulk_create(
+        [Attribute(name=name) for name in ATTRIBUTES]
+    )
+    values = AttributeValue.objects.bulk_create(
+        [
+            AttributeValue(attribute=attribute, attribute_value=value)
+            for attribute in attributes
+            for value in ATTRIBUTES[attribute.name]
+        ]
+    )
+    values_by_attribute = {}
+    for value in values:
+        values_by_attribute.setdefault(value.attribute_id, []).append(value)
+    product_types = ProductType.objects.bulk_create(
+        [ProductType(name=f"type{n}") for n in range(types)]
+    )
+    type_attributes = {
+        product_type.pk: rng.sample(attributes, rng.randint(2, 4))
+        for product_type in product_types
+    }
+    ProductTypeAttribute.objects.bulk_create(
+        [
+            ProductTypeAttribute(product_type_id=type_id, attribute=attribute)
+            for type_id, attributes in type_attributes.items()
+            for attribute in attributes
+        ]
+    )
+    return product_types, type_attributes, values_by_attribute
+
+
+def create_catalog(size, seed=0, batch_size=5000):
+    """
+    Creates a catalog of size products (see above), returns what the benchmarks need.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    vocabulary = words(5000, rng)
+    categories = create_categories()
+    product_types, type_attributes, values_by_attribute = create_product_types(rng)
+    catalog = Catalog(
+        size=size,
+        vocabulary=vocabulary,
+        category_slugs=[category.slug for category in categories],
+        attribute_values={
+            attribute_id: [value.attribute_value for value in values]
+            for attribute_id, values in values_by_attribute.items()
+        },
+    )
+    for start in range(0, size, batch_size):
+        create_products(
+            range(start, min(start + batch_size, size)),
+            rng,
+            catalog,
+            categories,
+            product_types,
+            type_attributes,
+            values_by_attribute,
+        )
+    catalog.seconds = time.perf_counter() - started
+    return catalog
+
+
+def create_products(
+    numbers, rng, catalog, categories, product_types, type_attributes, values
+):
+    products = Product.objects.bulk_create(
+        [
+            Product(
+                name=" ".join(rng.choices(catalog.vocabulary, k=3)),
+                slug=f"product-{n}",
+                pid=str(n),
+                description=" ".join(rng.choices(catalog.vocabulary, k=20)),
+                category=rng.choice(categories),
+                product_type=rng.choice(product_types),
+                is_active=rng.random() < 0.95,
+                last_line_order=rng.randint(1, 4),
+            )
+            for n in numbers
+        ]
+    )
+    lines = ProductLine.objects.bulk_create(
+        [
+            ProductLine(
+                product=product,
+                product_type_id=product.product_type_id,
+                sku=f"{product.pid}-{order}",
+                price=Decimal(rng.randint(100, 50000)) / 100,
+                stock_qty=rng.choice([0, rng.randint(1, 500)]),
+                weight=rng.randint(1, 5000) / 100,
+                is_active=rng.random() < 0.9,
+                order=order,
+                last_image_order=rng.randint(1, 3),
+            )
+            for product in products
+            for order in range(1, product.last_line_order + 1)
+        ]
+    )
+    catalog.skus += [line.sku for line in lines[:: max(1, len(lines) // 100)]]
+    ProductImage.objects.bulk_create(
+        [
+            ProductImage(
+                product_line=line,
+                alternative_text=f"{line.sku} image {order}",
+                url=f"images/{line.sku}-{order}.jpg",
+                order=order,
+            )
+            for line in lines
+            for order in range(1, line.last_image_order + 1)
+        ]
+    )
+    ProductLineAttributeValue.objects.bulk_create(
+        [
+            ProductLineAttributeValue(
+                product_line=line,
+                attribute=attribute,
+                attribute_value=rng.choice(values[attribute.pk]),
+            )
+            for line in lines
+            for attribute in type_attributes[line.product_type_id]
+        ]
+    )
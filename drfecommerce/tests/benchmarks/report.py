@@ -0,0 +1,44 @@
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+from django.db import connection
+
+"""
+Result files of the benchmarks: <BENCHMARK_OUTPUT>/<name>-<commit>.json (default
+benchmark-results/), so runs of different commits can be compared side by side.
+"""
+
+OUTPUT = Path(os.environ.get("BENCHMARK_OUTPUT", "benchmark-results"))
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_report(name, **results):
+    report = {
+        "commit": commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "database": connection.vendor,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        **results,
+    }
+    OUTPUT.mkdir(parents=True, exist_ok=True)
+    path = OUTPUT / f"{name}-{report['commit']}.json"
+    path.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"results written to {path}")
+    return path
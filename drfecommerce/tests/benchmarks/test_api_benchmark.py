@@ -0,0 +1,164 @@
+import logging
+import os
+import random
+import statistics
+import time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from drfecommerce.product.documents import rebuild_product_documents
+from drfecommerce.product.search import rebuild_search_index
+
+from .catalog import create_catalog, parse_scales
+from .report import write_report
+
+"""
+Latency, throughput and query counts of every API endpoint, on synthetic catalogs
+(see catalog.py). Skipped unless the scales are given, e.g.:
+
+    BENCHMARK_PRODUCTS=1k,100k pytest drfecommerce/tests/benchmarks/test_api_benchmark.py -s
+
+Every scale writes <BENCHMARK_OUTPUT>/<scale>-<commit>.json (see report.py).
+BENCHMARK_REQUESTS sets the number of requests per endpoint (default 100), the export
+streams the whole catalog and runs only once.
+
+Requests go through the test client, in process and one after another: throughput is
+requests per second of a single worker, without network and server overhead.
+"""
+
+SCALES = parse_scales(os.environ.get("BENCHMARK_PRODUCTS", ""))
+REQUESTS = int(os.environ.get("BENCHMARK_REQUESTS", 100))
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(not SCALES, reason="set BENCHMARK_PRODUCTS to run"),
+]
+
+
+def endpoints(catalog, rng):
+    """
+    (name, number of requests, function returning the next request) of every endpoint.
+    """
+
+    def get(path, params=None):
+        return lambda: ("get", path, params or {})
+
+    def random_get(path, params):
+        # a new random path and parameters for every request
+        return lambda: ("get", path(), params())
+
+    def slug():
+        return f"product-{rng.randrange(catalog.size)}"
+
+    def word():
+        return rng.choice(catalog.vocabulary)
+
+    attribute_id = rng.choice(list(catalog.attribute_values))
+    value = rng.choice(catalog.attribute_values[attribute_id])
+    return [
+        ("category-list", REQUESTS, get("/api/category/")),
+        ("category-tree", REQUESTS, get("/api/category/tree/")),
+        ("product-list", REQUESTS, get("/api/product/")),
+        ("product-list-sparse", REQUESTS, get("/api/product/", {"fields": "name"})),
+        ("product-list-sort-price", REQUESTS, get("/api/product/", {"sort": "price"})),
+        (
+            "product-list-facets",
+            REQUESTS,
+            get(
+                "/api/product/",
+                {"attr": f"{attribute_id}:{value}", "in_stock": "1", "facets": "1"},
+            ),
+        ),
+        (
+            "product-detail",
+            REQUESTS,
+            random_get(lambda: f"/api/product/{slug()}/", dict),
+        ),
+        (
+            "product-category",
+            REQUESTS,
+            random_get(
+                lambda: f"/api/product/category/{rng.choice(catalog.category_slugs)}/all/",
+                lambda: {"include_descendants": "true"},
+            ),
+        ),
+        (
+            "product-search",
+            REQUESTS,
+            random_get(lambda: "/api/product/search/", lambda: {"q": word()}),
+        ),
+        ("product-cache-stats", REQUESTS, get("/api/product/cache_stats/")),
+        ("product-export", 1, get("/api/product/export/")),
+        (
+            "productline-resolve",
+            REQUESTS,
+            lambda: (
+                "post",
+                "/api/productline/resolve/",
+                {"skus": rng.sample(catalog.skus, min(100, len(catalog.skus)))},
+            ),
+        ),
+        ("schema", max(1, REQUESTS // 10), get("/api/schema/")),
+        ("schema-docs", REQUESTS, get("/api/schema/docs/")),
+    ]
+
+
+def measure(client, requests, next_request):
+    timings = []
+    queries = []
+    for _ in range(requests):
+        method, path, data = next_request()
+        kwargs = {"format": "json"} if method == "post" else {}
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data, **kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, (path, response.status_code)
+        queries.append(len(captured))
+    if len(timings) > 1:
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+    else:
+        percentiles = timings * 99
+    return {
+        "requests": requests,
+        "p50_ms": round(percentiles[49], 2),
+        "p95_ms": round(percentiles[94], 2),
+        "p99_ms": round(percentiles[98], 2),
+        "mean_ms": round(statistics.fmean(timings), 2),
+        "throughput_rps": round(requests / (sum(timings) / 1000), 1),
+        "queries_median": statistics.median(queries),
+        "queries_max": max(queries),
+    }
+
+
+@pytest.mark.parametrize("label,size", SCALES)
+def test_api_benchmark(label, size, api_client, admin_user, caplog):
+    # the query counts are measured here, no need for a log line per request
+    caplog.set_level(logging.WARNING, logger="drfecommerce.queries")
+    catalog = create_catalog(size)
+    setup = {"catalog_s": round(catalog.seconds, 1)}
+    for name, rebuild in (
+        ("documents_s", rebuild_product_documents),
+        ("search_index_s", rebuild_search_index),
+    ):
+        started = time.perf_counter()
+        rebuild()
+        setup[name] = round(time.perf_counter() - started, 1)
+
+    client = api_client()
+    # cache_stats is for admins only, the other endpoints don't look at the user
+    client.force_authenticate(admin_user)
+    rng = random.Random(1)
+    results = {}
+    for name, requests, next_request in endpoints(catalog, rng):
+        results[name] = measure(client, requests, next_request)
+        print(
+            f"{label} {name}: p50 {results[name]['p50_ms']}ms, "
+            f"p95 {results[name]['p95_ms']}ms, {results[name]['queries_max']} queries"
+        )
+
+    write_report(label, scale=label, products=size, setup=setup, endpoints=results)
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import statistics
+import threading
+import time
+
+import pytest
+from django.core.asgi import get_asgi_application
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer,
+    get_internal_wsgi_application,
+)
+from django.test.testcases import QuietWSGIRequestHandler
+
+from drfecommerce.product.documents import rebuild_product_documents
+
+from .catalog import create_catalog, parse_scales
+from .report import write_report
+
+"""
+The async endpoints (product/async_views.py) under uvicorn against the sync viewsets,
+with many concurrent clients. Skipped unless the scales are given, e.g.:
+
+    BENCHMARK_PRODUCTS=1k BENCHMARK_CONCURRENCY=16,256 \\
+        pytest drfecommerce/tests/benchmarks/test_asgi_benchmark.py -s
+
+Three servers, each on a real socket:
+- wsgi:       the viewsets behind Django's threaded WSGI server (a thread per request)
+- asgi-sync:  the viewsets under uvicorn
+- asgi-async: the async views under uvicorn
+
+For every concurrency in BENCHMARK_CONCURRENCY (default 16,128), that many clients send
+BENCHMARK_REQUESTS requests (default 1000) per endpoint, as fast as the server answers.
+Results are written to <BENCHMARK_OUTPUT>/asgi-<scale>-<commit>.json (see report.py).
+
+Servers and clients run in this process, on the test database: compare the servers
+with each other, the absolute numbers are not the capacity of a deployment.
+"""
+
+SCALES = parse_scales(os.environ.get("BENCHMARK_PRODUCTS", ""))
+CONCURRENCY = [
+    int(value) for value in os.environ.get("BENCHMARK_CONCURRENCY", "16,128").split(",")
+]
+REQUESTS = int(os.environ.get("BENCHMARK_REQUESTS", 1000))
+
+pytestmark = [
+    # the servers run in other threads, they only see committed data
+    pytest.mark.django_db(transaction=True),
+    pytest.mark.skipif(not SCALES, reason="set BENCHMARK_PRODUCTS to run"),
+]
+
+
+class WSGIServer(ThreadedWSGIServer):
+    # the default backlog of 10 would drop connections at high concurrency
+    request_queue_size = 1024
+
+
+def listening_socket():
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(1024)
+    return sock
+
+
+def start_wsgi():
+    server = WSGIServer(("127.0.0.1", 0), QuietWSGIRequestHandler)
+    server.set_app(get_internal_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+
+    return server.server_address[1], stop
+
+
+def start_asgi():
+    uvicorn = pytest.importorskip("uvicorn")
+    sock = listening_socket()
+    server = uvicorn.Server(
+        uvicorn.Config(
+            get_asgi_application(),
+            lifespan="off",
+            log_level="warning",
+            access_log=False,
+            backlog=1024,
+        )
+    )
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]})
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+    return sock.getsockname()[1], stop
+
+
+async def fetch(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: testserver\r\nConnection: close\r\n\r\n".encode()
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return int(response.split(b" ", 2)[1])
+
+
+async def load(port, next_path, concurrency, requests):
+    """
+    Sends requests from concurrency clients at once, returns the timings and wall time.
+    """
+    timings = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            path = next_path()
+            started = time.perf_counter()
+            status = await fetch(port, path)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert status == 200, (path, status)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return timings, time.perf_counter() - started
+
+
+def summary(timings, seconds):
+    percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "requests": len(timings),
+        "p50_ms": round(percentiles[49], 2),
+        "p95_ms": round(percentiles[94], 2),
+        "p99_ms": round(percentiles[98], 2),
+        "throughput_rps": round(len(timings) / seconds, 1),
+    }
+
+
+@pytest.mark.parametrize("label,size", SCALES)
+def test_asgi_benchmark(label, size, caplog):
+    caplog.set_level(logging.WARNING, logger="drfecommerce.queries")
+    catalog = create_catalog(size)
+    rebuild_product_documents()
+    rng = random.Random(1)
+
+    def detail():
+        return f"product/product-{rng.randrange(catalog.size)}/"
+
+    endpoints = {
+        "category-list": lambda: "category/",
+        "category-tree": lambda: "category/tree/",
+        "product-list": lambda: "product/",
+        "product-detail": detail,
+    }
+    servers = [
+        ("wsgi", start_wsgi, "/api/"),
+        ("asgi-sync", start_asgi, "/api/"),
+        ("asgi-async", start_asgi, "/api/async/"),
+    ]
+    results = {}
+    for server, start, prefix in servers:
+        port, stop = start()
+        try:
+            for concurrency in CONCURRENCY:
+                for name, path in endpoints.items():
+                    timings, seconds = asyncio.run(
+                        load(port, lambda: prefix + path(), concurrency, REQUESTS)
+                    )
+                    result = summary(timings, seconds)
+                    results.setdefault(name, {}).setdefault(str(concurrency), {})[
+                        server
+                    ] = result
+                    print(
+                        f"{label} {name} x{concurrency} {server}: "
+                        f"{result['throughput_rps']} req/s, p50 {result['p50_ms']}ms, "
+                        f"p99 {result['p99_ms']}ms"
+                    )
+        finally:
+            stop()
+
+    write_report(
+        f"asgi-{label}",
+        scale=label,
+        products=size,
+        requests=REQUESTS,
+        endpoints=results,
+    )
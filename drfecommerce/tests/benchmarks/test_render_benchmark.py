@@ -0,0 +1,134 @@
+import os
+import time
+
+import pytest
+from django.db.models import prefetch_related_objects
+
+from drfecommerce.product.models import (
+    Attribute,
+    AttributeValue,
+    Category,
+    Product,
+    ProductImage,
+    ProductLine,
+    ProductLineAttributeValue,
+    ProductQueryset,
+    ProductType,
+)
+from drfecommerce.product.render import product_values, render_products
+from drfecommerce.product.serializers import ProductSerializer
+
+"""
+ProductSerializer against the fast path of render.py, on full listing pages.
+Skipped unless asked for: BENCHMARK_RENDER=1 pytest drfecommerce/tests/benchmarks -s
+
+Both sides start from the page of products and include loading their relations
+(prefetch_related_objects + serializer vs. the .values() queries + plain functions),
+which is what a listing request spends after fetching the page.
+"""
+
+PAGE_SIZE = 100
+LINES = 3
+# both sides are measured in alternating blocks of ROUNDS runs: a slow stretch of the
+# machine (seconds at times) would otherwise fall on all runs of one side
+BLOCKS = 10
+ROUNDS = 4
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(
+        not os.environ.get("BENCHMARK_RENDER"), reason="set BENCHMARK_RENDER to run"
+    ),
+]
+
+
+def create_page():
+    attributes = Attribute.objects.bulk_create(
+        [Attribute(name=name) for name in ("color", "size", "material")]
+    )
+    product_type = ProductType.objects.create(name="benchmark")
+    product_type.attribute.set(attributes)
+    values = AttributeValue.objects.bulk_create(
+        [
+            AttributeValue(attribute=attribute, attribute_value="x")
+            for attribute in attributes
+        ]
+    )
+    category = Category.objects.create(name="benchmark", slug="benchmark")
+    products = Product.objects.bulk_create(
+        [
+            Product(
+                name=f"product {n}",
+                slug=f"product-{n}",
+                pid=str(n),
+                description="benchmark product " * 10,
+                category=category,
+                product_type=product_type,
+                is_active=True,
+            )
+            for n in range(PAGE_SIZE)
+        ]
+    )
+    lines = ProductLine.objects.bulk_create(
+        [
+            ProductLine(
+                product=product,
+                sku=f"{product.pid}-{n}",
+                price=10 + n,
+                stock_qty=n,
+                weight=1,
+                order=n + 1,
+                is_active=True,
+                product_type=product_type,
+            )
+            for product in products
+            for n in range(LINES)
+        ]
+    )
+    ProductImage.objects.bulk_create(
+        [
+            ProductImage(product_line=line, alternative_text="image", order=n + 1)
+            for line in lines
+            for n in range(2)
+        ]
+    )
+    ProductLineAttributeValue.objects.bulk_create(
+        [
+            ProductLineAttributeValue(
+                product_line=line, attribute_value=value, attribute=value.attribute
+            )
+            for line in lines
+            for value in values
+        ]
+    )
+
+
+def test_render_speedup():
+    create_page()
+    queryset = Product.objects.with_related().prefetch_related(None)
+
+    def serializer():
+        page = list(queryset)
+        started = time.perf_counter()
+        prefetch_related_objects(page, *ProductQueryset.prefetch_lookups())
+        ProductSerializer(page, many=True).data
+        return time.perf_counter() - started
+
+    def fast():
+        rows = list(queryset.values(*product_values()))
+        started = time.perf_counter()
+        render_products(rows)
+        return time.perf_counter() - started
+
+    slow_times, fast_times = [], []
+    for _ in range(BLOCKS):
+        slow_times += [serializer() for _ in range(ROUNDS)]
+        fast_times += [fast() for _ in range(ROUNDS)]
+    slow_time = min(slow_times)
+    fast_time = min(fast_times)
+    speedup = slow_time / fast_time
+    print(
+        f"\n{PAGE_SIZE} products: serializer {slow_time * 1000:.1f}ms, "
+        f"fast path {fast_time * 1000:.1f}ms, {speedup:.1f}x"
+    )
+    assert speedup >= 5
@@ -0,0 +1,46 @@
+import os
+import random
+import statistics
+import time
+
+import pytest
+
+from drfecommerce.product.search import rebuild_search_index
+
+from .catalog import create_catalog, parse_scales
+
+"""
+Latency of the search endpoint on a synthetic catalog (see catalog.py). Skipped unless
+the catalog sizes are given, e.g.: BENCHMARK_PRODUCTS=1m pytest drfecommerce/tests/benchmarks -s
+"""
+
+SCALES = parse_scales(os.environ.get("BENCHMARK_PRODUCTS", ""))
+QUERIES = 200
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(not SCALES, reason="set BENCHMARK_PRODUCTS to run"),
+]
+
+
+@pytest.mark.parametrize("label,size", SCALES)
+def test_search_latency(label, size, api_client):
+    rng = random.Random(0)
+    vocabulary = create_catalog(size).vocabulary
+    started = time.perf_counter()
+    rebuild_search_index(batch_size=5000)
+    print(f"\nindexed {size} products in {time.perf_counter() - started:.0f}s")
+
+    client = api_client()
+    timings = []
+    for _ in range(QUERIES):
+        # one or two words, the second one typed halfway (prefix match)
+        q = rng.choice(vocabulary)
+        if rng.random() < 0.5:
+            q += " " + rng.choice(vocabulary)[:3]
+        started = time.perf_counter()
+        assert client.get("/api/product/search/", {"q": q}).status_code == 200
+        timings.append((time.perf_counter() - started) * 1000)
+    percentiles = statistics.quantiles(timings, n=100)
+    p50, p95 = percentiles[49], percentiles[94]
+    print(f"search: p50 {p50:.1f}ms, p95 {p95:.1f}ms over {QUERIES} queries")
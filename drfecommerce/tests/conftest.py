@@ -1,7 +1,10 @@
 import pytest
+from django.core.cache import cache
 from pytest_factoryboy import register
 from rest_framework.test import APIClient
 
+from drfecommerce.product.skus import sku_cache
+
 from .factories import (
     AttributeFactory,
     AttributeValueFactory,
@@ -27,3 +30,42 @@ register(ProductLineAttributeValueFactory)
 @pytest.fixture
 def api_client():
     return APIClient
+
+
+@pytest.fixture
+def catalog(
+    product_factory,
+    product_line_factory,
+    product_image_factory,
+    attribute_factory,
+    attribute_value_factory,
+    product_type_factory,
+):
+    # every product gets a type attribute, a line with a specification and an image,
+    # so that every relation ProductSerializer touches is populated.
+    def create(size, **kwargs):
+        for _ in range(size):
+            attribute = attribute_factory()
+            product = product_factory(
+                product_type=product_type_factory(attribute=[attribute]), **kwargs
+            )
+            product_line = product_line_factory(
+                product=product,
+                attribute_value=[attribute_value_factory(attribute=attribute)],
+            )
+            product_image_factory(product_line=product_line)
+
+    return create
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # cached read models must not leak from one test into the next
+    cache.clear()
+    sku_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def strict_query_budgets(settings):
+    # a request over the query budget of its view fails the test (see middleware.py)
+    settings.QUERY_BUDGET_STRICT = True
@@ -53,6 +53,7 @@ class ProductFactory(factory.django.DjangoModelFactory):
         model = Product
 
     name = factory.Sequence(lambda n: f"test_product_{n}")
+    slug = factory.Sequence(lambda n: f"test_product_slug_{n}")
     pid = factory.Sequence(lambda n: f"0000_{n}")
     description = "test_description"
     is_digital = True
@@ -80,20 +81,21 @@ class ProductLineFactory(factory.django.DjangoModelFactory):
         model = ProductLine
 
     price = 10.00
-    sku = "12345"
+    sku = factory.Sequence(lambda n: f"test_sku_{n}")
     stock_qty = 10
     product = factory.SubFactory(ProductFactory)
     is_active = True
     weight = 100
     product_type = factory.SubFactory(ProductTypeFactory)
 
-    # same as in AttributeType: many-to-many relationship
+    # same as in AttributeType: many-to-many relationship,
+    # but added with set_attribute_values (see models.py)
     # see test_models.py / TestProductLineModel for example how to call this.
     @factory.post_generation
     def attribute_value(self, create, extracted, **kwargs):
         if not create or not extracted:
             return
-        self.attribute_value.add(*extracted)
+        self.set_attribute_values(extracted)
 
 
 class ProductImageFactory(factory.django.DjangoModelFactory):
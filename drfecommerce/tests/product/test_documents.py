@@ -0,0 +1,129 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from drfecommerce.product.documents import refresh_product_documents
+from drfecommerce.product.models import Product, ProductDocument
+from drfecommerce.product.serializers import ProductSerializer
+
+pytestmark = pytest.mark.django_db
+
+
+def serialized(product):
+    product = Product.objects.with_related().get(pk=product.pk)
+    return json.loads(json.dumps(ProductSerializer(product).data))
+
+
+class TestProductDocument:
+    def test_refresh_matches_serializer(
+        self, product_factory, product_line_factory, product_image_factory
+    ):
+        product = product_factory()
+        product_image_factory(product_line=product_line_factory(product=product))
+        refresh_product_documents([product.pk])
+        assert ProductDocument.objects.get(pk=product.pk).document == serialized(
+            product
+        )
+
+    def test_refresh_removes_inactive_products(self, product_factory):
+        product = product_factory()
+        refresh_product_documents([product.pk])
+        Product.objects.filter(pk=product.pk).update(is_active=False)
+        refresh_product_documents([product.pk])
+        assert not ProductDocument.objects.exists()
+
+    def test_updated_on_change(
+        self,
+        product_line_factory,
+        attribute_value_factory,
+        django_capture_on_commit_callbacks,
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            product_line = product_line_factory()
+            attribute_value = attribute_value_factory(attribute_value="red")
+            product_line.set_attribute_values([attribute_value])
+        product = product_line.product
+        assert ProductDocument.objects.get(pk=product.pk).document == serialized(
+            product
+        )
+        with django_capture_on_commit_callbacks(execute=True):
+            attribute_value.attribute_value = "blue"
+            attribute_value.save()
+        document = ProductDocument.objects.get(pk=product.pk).document
+        assert list(document["product_line"][0]["specification"].values()) == ["blue"]
+        with django_capture_on_commit_callbacks(execute=True):
+            product.is_active = False
+            product.save()
+        assert not ProductDocument.objects.exists()
+
+    def test_updated_when_rows_move(
+        self,
+        product_factory,
+        product_line_factory,
+        product_image_factory,
+        django_capture_on_commit_callbacks,
+    ):
+        a, b = product_factory.create_batch(2)
+        with django_capture_on_commit_callbacks(execute=True):
+            line = product_line_factory(product=a, sku="moved")
+            other_line = product_line_factory(product=b)
+            image = product_image_factory(product_line=line)
+        with django_capture_on_commit_callbacks(execute=True):
+            image.product_line = other_line
+            image.save()
+        # the product the row was moved away from is refreshed as well
+        for product in (a, b):
+            assert ProductDocument.objects.get(pk=product.pk).document == serialized(
+                product
+            )
+        with django_capture_on_commit_callbacks(execute=True):
+            # orders are unique per product
+            line.product, line.order = b, 2
+            line.save()
+        assert ProductDocument.objects.get(pk=a.pk).document["product_line"] == []
+        assert ProductDocument.objects.get(pk=b.pk).document == serialized(b)
+
+    def test_refreshed_in_chunks(
+        self,
+        category_factory,
+        product_factory,
+        monkeypatch,
+        django_capture_on_commit_callbacks,
+    ):
+        category = category_factory()
+        with django_capture_on_commit_callbacks(execute=True):
+            products = product_factory.create_batch(5, category=category)
+        # refresh_product_documents takes two lists of ids: chunks of two products
+        monkeypatch.setattr(connection.features, "max_query_params", 4)
+        with CaptureQueriesContext(connection) as queries:
+            with django_capture_on_commit_callbacks(execute=True):
+                category.name = "renamed"
+                category.save()
+        updates = [
+            query
+            for query in queries
+            if query["sql"].startswith('UPDATE "product_product" SET "updated_at"')
+        ]
+        assert len(updates) == 3
+        for product in products:
+            document = ProductDocument.objects.get(pk=product.pk).document
+            assert document["category_name"] == "renamed"
+
+    def test_retrieve_reads_document(
+        self, product_factory, api_client, django_assert_num_queries
+    ):
+        product = product_factory(slug="test-slug")
+        refresh_product_documents([product.pk])
+        ProductDocument.objects.filter(pk=product.pk).update(document={"name": "doc"})
+        with django_assert_num_queries(1):
+            response = api_client().get("/api/product/test-slug/")
+        assert json.loads(response.content) == [{"name": "doc"}]
+
+    def test_rebuild_command(self, product_factory):
+        product_factory.create_batch(3)
+        product_factory(is_active=False)
+        call_command("rebuild_product_documents", batch_size=2)
+        assert ProductDocument.objects.count() == 3
@@ -1,59 +1,584 @@
-# import json
-
-# import pytest
-
-# pytestmark = pytest.mark.django_db
-
-
-# class TestCategoryEndpoints:
-#     endpoint = "/api/category/"
-
-#     def test_category_get(self, category_factory, api_client):
-#         # Arrange
-#         category_factory.create_batch(4)
-#         # Act
-#         response = api_client().get(self.endpoint)
-#         # Assert
-#         assert response.status_code == 200
-#         assert len(json.loads(response.content)) == 4
-
-
-# class TestBrandEndpoints:
-#     endpoint = "/api/brand/"
-
-#     def test_brand_get(self, brand_factory, api_client):
-#         # Arrange
-#         brand_factory.create_batch(4)
-#         # Act
-#         response = api_client().get(self.endpoint)
-#         # Assert
-#         assert response.status_code == 200
-#         assert len(json.loads(response.content)) == 4
-
-
-# class TestProductEndpoints:
-#     endpoint = "/api/product/"
-
-#     def test_return_all_products(self, product_factory, api_client):
-#         # Arrange
-#         product_factory.create_batch(4)
-#         # Act
-#         response = api_client().get(self.endpoint)
-#         # Assert
-#         assert response.status_code == 200
-#         assert len(json.loads(response.content)) == 4
-
-#     def test_return_single_product_by_slug(self, product_factory, api_client):
-#         obj = product_factory(slug="test-slug")
-#         response = api_client().get(f"{self.endpoint}{obj.slug}/")
-#         assert response.status_code == 200
-#         assert len(json.loads(response.content)) == 1
-
-#     def test_return_products_by_category_slug(
-#         self, product_factory, category_factory, api_client
-#     ):
-#         obj = category_factory(slug="test-slug")
-#         product_factory(category=obj)
-#         response = api_client().get(f"{self.endpoint}category/{obj.slug}/all/")
-#         assert response.status_code == 200
-#         assert len(json.loads(response.content)) == 1
+import json
+import threading
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+
+from drfecommerce.middleware import QueryBudgetExceeded
+from drfecommerce.product import async_views
+from drfecommerce.product.cache import product_cache_stats
+from drfecommerce.product.filters import FacetIndex
+from drfecommerce.product.models import ProductLine
+from drfecommerce.product.skus import LRUCache, sku_cache
+from drfecommerce.product.views import ProductViewSet
+
+pytestmark = pytest.mark.django_db
+
+
+class TestCategoryEndpoints:
+    endpoint = "/api/category/"
+
+    def test_category_tree(self, category_factory, api_client):
+        root = category_factory(name="b_root")
+        category_factory(name="b_child", parent=root)
+        category_factory(name="a_root")
+        response = api_client().get(f"{self.endpoint}tree/")
+        assert response.status_code == 200
+        data = json.loads(response.content)
+        assert [node["category_name"] for node in data] == ["a_root", "b_root"]
+        assert data[1]["children"][0]["category_name"] == "b_child"
+        assert data[1]["children"][0]["children"] == []
+
+    def test_category_tree_is_cached(
+        self, category_factory, api_client, django_assert_num_queries
+    ):
+        category_factory()
+        with django_assert_num_queries(1):
+            api_client().get(f"{self.endpoint}tree/")
+        with django_assert_num_queries(0):
+            api_client().get(f"{self.endpoint}tree/")
+
+    def test_category_tree_not_modified(self, category_factory, api_client):
+        category_factory()
+        response = api_client().get(f"{self.endpoint}tree/")
+        etag = response.headers["ETag"]
+        response = api_client().get(f"{self.endpoint}tree/", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_category_list_not_modified(
+        self, category_factory, api_client, django_assert_num_queries
+    ):
+        category = category_factory()
+        etag = api_client().get(self.endpoint).headers["ETag"]
+        # only the aggregate query, the categories are not loaded
+        with django_assert_num_queries(1):
+            response = api_client().get(self.endpoint, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        category.name = "renamed"
+        category.save()
+        response = api_client().get(self.endpoint, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_category_tree_invalidated_on_change(
+        self, category_factory, api_client, django_capture_on_commit_callbacks
+    ):
+        def tree():
+            return json.loads(api_client().get(f"{self.endpoint}tree/").content)
+
+        root = category_factory(name="a_root")
+        other = category_factory(name="b_root")
+        tree()
+        with django_capture_on_commit_callbacks(execute=True):
+            child = category_factory(name="child", parent=root)
+        assert len(tree()[0]["children"]) == 1
+        with django_capture_on_commit_callbacks(execute=True):
+            child.move_to(other)
+        assert len(tree()[0]["children"]) == 0
+        assert len(tree()[1]["children"]) == 1
+        with django_capture_on_commit_callbacks(execute=True):
+            child.delete()
+        assert len(tree()[1]["children"]) == 0
+
+
+class TestProductEndpoints:
+    endpoint = "/api/product/"
+
+    def test_return_all_products(self, catalog, api_client):
+        catalog(3)
+        response = api_client().get(self.endpoint)
+        assert response.status_code == 200
+        data = json.loads(response.content)["results"]
+        assert len(data) == 3
+        assert len(data[0]["product_line"][0]["product_image"]) == 1
+        assert len(data[0]["product_line"][0]["specification"]) == 1
+        assert len(data[0]["type specification"]) == 1
+
+    def test_return_single_product_by_slug(self, product_factory, api_client):
+        obj = product_factory(slug="test-slug")
+        response = api_client().get(f"{self.endpoint}{obj.slug}/")
+        assert response.status_code == 200
+        assert len(json.loads(response.content)) == 1
+
+    def test_retrieve_is_cached(self, catalog, api_client, django_assert_num_queries):
+        catalog(1, slug="test-slug")
+        response = api_client().get(f"{self.endpoint}test-slug/")
+        with django_assert_num_queries(0):
+            cached = api_client().get(f"{self.endpoint}test-slug/")
+        assert cached.content == response.content
+        assert product_cache_stats() == {"hits": 1, "misses": 1}
+
+    def test_retrieve_cache_invalidated_on_change(
+        self,
+        product_factory,
+        product_line_factory,
+        product_image_factory,
+        attribute_value_factory,
+        api_client,
+        django_capture_on_commit_callbacks,
+    ):
+        def retrieve(slug="test-slug"):
+            return json.loads(api_client().get(f"{self.endpoint}{slug}/").content)
+
+        product = product_factory(slug="test-slug")
+        other = product_line_factory()
+        assert retrieve()[0]["product_line"] == []
+        with django_capture_on_commit_callbacks(execute=True):
+            product_line = product_line_factory(product=product)
+        assert len(retrieve()[0]["product_line"]) == 1
+        with django_capture_on_commit_callbacks(execute=True):
+            product_image_factory(product_line=product_line)
+        assert len(retrieve()[0]["product_line"][0]["product_image"]) == 1
+        with django_capture_on_commit_callbacks(execute=True):
+            product_line.set_attribute_values([attribute_value_factory()])
+        assert len(retrieve()[0]["product_line"][0]["specification"]) == 1
+        # changes to other products keep the entry
+        with django_capture_on_commit_callbacks(execute=True):
+            product_image_factory(product_line=other)
+        retrieve()
+        assert product_cache_stats()["hits"] == 1
+        with django_capture_on_commit_callbacks(execute=True):
+            product.slug = "new-slug"
+            product.save()
+        assert retrieve() == []
+        assert len(retrieve("new-slug")) == 1
+
+    def test_retrieve_not_modified(
+        self,
+        catalog,
+        product_image_factory,
+        api_client,
+        django_capture_on_commit_callbacks,
+    ):
+        endpoint = f"{self.endpoint}test-slug/"
+        catalog(1, slug="test-slug")
+        response = api_client().get(endpoint)
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+        response = api_client().get(endpoint, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response.content == b""
+        response = api_client().get(endpoint, HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == 304
+        # a new image changes the output, and so the validators
+        with django_capture_on_commit_callbacks(execute=True):
+            product_image_factory(product_line=ProductLine.objects.get())
+        response = api_client().get(endpoint, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    @pytest.mark.parametrize("path", ["", "category/test-slug/all/"])
+    def test_list_not_modified(
+        self,
+        path,
+        catalog,
+        category_factory,
+        api_client,
+        django_assert_num_queries,
+        django_capture_on_commit_callbacks,
+    ):
+        category = category_factory(slug="test-slug")
+        catalog(2, category=category)
+        endpoint = f"{self.endpoint}{path}"
+        etag = api_client().get(endpoint).headers["ETag"]
+        # only the page itself is queried, nothing is prefetched or serialized
+        with django_assert_num_queries(1):
+            response = api_client().get(endpoint, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        # other query parameters are another response
+        response = api_client().get(f"{endpoint}?page_size=1", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        with django_capture_on_commit_callbacks(execute=True):
+            ProductLine.objects.first().save()
+        response = api_client().get(endpoint, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_cache_stats_admin_only(self, admin_client, api_client):
+        assert api_client().get(f"{self.endpoint}cache_stats/").status_code == 403
+        response = admin_client.get(f"{self.endpoint}cache_stats/")
+        assert json.loads(response.content) == {"hits": 0, "misses": 0}
+
+    def test_return_products_by_category_slug(
+        self, product_factory, category_factory, api_client
+    ):
+        obj = category_factory(slug="test-slug")
+        product_factory(category=obj)
+        product_factory()
+        response = api_client().get(f"{self.endpoint}category/{obj.slug}/all/")
+        assert response.status_code == 200
+        assert len(json.loads(response.content)["results"]) == 1
+
+    def test_return_products_by_category_subtree(
+        self, product_factory, category_factory, api_client, django_assert_num_queries
+    ):
+        root = category_factory(slug="test-slug")
+        child = category_factory(parent=root)
+        product_factory(category=root)
+        product_factory(category=child)
+        product_factory(category=category_factory(parent=child))
+        product_factory(category=category_factory())
+        endpoint = f"{self.endpoint}category/{root.slug}/all/"
+        response = api_client().get(endpoint)
+        assert len(json.loads(response.content)["results"]) == 1
+        # products, product lines, type attributes: the subtree adds no query
+        with django_assert_num_queries(3):
+            response = api_client().get(f"{endpoint}?include_descendants=true")
+        assert len(json.loads(response.content)["results"]) == 3
+
+    @pytest.mark.parametrize("path", ["", "category/test-slug/all/"])
+    def test_list_query_count_is_constant(
+        self, path, catalog, category_factory, api_client
+    ):
+        category = category_factory(slug="test-slug")
+        catalog(2, category=category)
+        with CaptureQueriesContext(connection) as small:
+            api_client().get(f"{self.endpoint}{path}")
+        catalog(10, category=category)
+        with CaptureQueriesContext(connection) as large:
+            response = api_client().get(f"{self.endpoint}{path}")
+        assert len(json.loads(response.content)["results"]) == 12
+        assert len(small) == len(large)
+
+    def test_cursor_pagination_walks_whole_catalog(self, product_factory, api_client):
+        product_factory.create_batch(5)
+        client = api_client()
+        response = json.loads(client.get(f"{self.endpoint}?page_size=2").content)
+        assert response["previous"] is None
+        slugs = [item["slug"] for item in response["results"]]
+        # products created while walking the catalog must not shift the next pages
+        product_factory.create_batch(2)
+        while response["next"]:
+            response = json.loads(client.get(response["next"]).content)
+            slugs += [item["slug"] for item in response["results"]]
+        assert len(slugs) == len(set(slugs)) == 7
+
+    def test_page_size_is_capped(self, product_factory, api_client, monkeypatch):
+        product_factory.create_batch(3)
+        monkeypatch.setattr(ProductViewSet.pagination_class, "max_page_size", 2)
+        response = api_client().get(f"{self.endpoint}?page_size=50")
+        assert len(json.loads(response.content)["results"]) == 2
+
+    @pytest.fixture
+    def shirts(self, product_line_factory, attribute_factory, attribute_value_factory):
+        color = attribute_factory(name="color")
+        size = attribute_factory(name="size")
+        values = {}
+
+        def line(slug, *specification):
+            for attribute, value in specification:
+                if value not in values:
+                    values[value] = attribute_value_factory(
+                        attribute=attribute, attribute_value=value
+                    )
+            product_line = product_line_factory(product__slug=slug)
+            product_line.set_attribute_values(
+                values[value] for _, value in specification
+            )
+            return product_line
+
+        red_m = line("red-m", (color, "red"), (size, "M"))
+        line("blue-m", (color, "blue"), (size, "M"))
+        line("red-s", (color, "red"), (size, "S"))
+        # red and M, but not on the same line
+        line("mixed", (color, "red"), (size, "S"))
+        blue_m = product_line_factory(product=red_m.product)
+        blue_m.set_attribute_values([values["blue"], values["M"]])
+        return color, size
+
+    def get_slugs(self, api_client, **params):
+        response = api_client().get(self.endpoint, params)
+        return sorted(item["slug"] for item in json.loads(response.content)["results"])
+
+    def test_filter_by_attribute(self, shirts, api_client):
+        color, size = shirts
+        assert self.get_slugs(api_client, attr=f"{color.id}:red") == [
+            "mixed",
+            "red-m",
+            "red-s",
+        ]
+        # values of one attribute are alternatives, attributes must match on one line
+        assert self.get_slugs(
+            api_client, attr=[f"{color.id}:red", f"{color.id}:blue", f"{size.id}:M"]
+        ) == ["blue-m", "red-m"]
+        assert self.get_slugs(api_client, attr=[f"{color.id}:red", f"{size.id}:M"]) == [
+            "red-m"
+        ]
+
+    def test_filter_by_attribute_invalid(self, api_client):
+        response = api_client().get(self.endpoint, {"attr": "color=red"})
+        assert response.status_code == 400
+
+    def test_attribute_facets(
+        self,
+        shirts,
+        api_client,
+        product_line_factory,
+        attribute_value_factory,
+        django_assert_num_queries,
+        django_capture_on_commit_callbacks,
+    ):
+        color, size = shirts
+
+        def facets():
+            params = {"attr": f"{size.id}:M", "facets": "true"}
+            return json.loads(api_client().get(self.endpoint, params).content)["facets"]
+
+        assert facets() == {
+            str(color.id): {"blue": 2, "red": 1},
+            str(size.id): {"M": 2},
+        }
+        # once the index is built, facets add one query (the product ids) to the listing
+        with django_assert_num_queries(6):
+            facets()
+        with django_capture_on_commit_callbacks(execute=True):
+            product_line_factory(product__slug="green-m").set_attribute_values(
+                [
+                    attribute_value_factory(attribute=color, attribute_value="green"),
+                    size.attribute_value.get(attribute_value="M"),
+                ]
+            )
+        assert facets()[str(color.id)] == {"blue": 2, "green": 1, "red": 1}
+        response = api_client().get(self.endpoint)
+        assert "facets" not in json.loads(response.content)
+
+    def test_facet_index_rebuilt_once(self, monkeypatch):
+        index = FacetIndex()
+        builds = []
+
+        def build():
+            builds.append(threading.get_ident())
+            time.sleep(0.05)
+            return [(1, "red"), (2, "M")], {7: (0, 1), 8: (0,)}
+
+        monkeypatch.setattr(index, "build", build)
+        # concurrent requests wait for the one rebuild instead of running their own
+        threads = [threading.Thread(target=index.counts, args=([7],)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(builds) == 1
+        assert index.counts([7, 8, 9]) == {1: {"red": 2}, 2: {"M": 1}}
+
+    @pytest.fixture
+    def priced(self, product_factory, product_line_factory):
+        def create(slug, *lines, **kwargs):
+            product = product_factory(slug=slug, **kwargs)
+            for price, stock_qty, is_active in lines:
+                product_line_factory(
+                    product=product,
+                    price=price,
+                    stock_qty=stock_qty,
+                    is_active=is_active,
+                )
+            return product
+
+        create("cheap", (5, 0, True), (30, 2, True))
+        create("mid", (20, 3, True))
+        create("pricey", (80, 1, True), (10, 5, False))
+        create("no-lines")
+
+    def test_price_range(self, priced, api_client):
+        response = api_client().get(self.endpoint, {"sort": "price"})
+        results = json.loads(response.content)["results"]
+        assert [(p["slug"], p["min_price"], p["max_price"]) for p in results] == [
+            ("cheap", "5.00", "30.00"),
+            ("mid", "20.00", "20.00"),
+            ("pricey", "80.00", "80.00"),
+        ]
+
+    def test_filter_by_price_and_stock(self, priced, api_client):
+        # inactive lines do not count, "pricey" has no active line below 50
+        assert self.get_slugs(api_client, max_price="15") == ["cheap"]
+        assert self.get_slugs(api_client, min_price="15", max_price="50") == [
+            "cheap",
+            "mid",
+        ]
+        # price and stock have to match on the same line
+        assert self.get_slugs(api_client, max_price="15", in_stock="true") == []
+        assert self.get_slugs(api_client, in_stock="1") == ["cheap", "mid", "pricey"]
+        response = api_client().get(self.endpoint, {"min_price": "cheap"})
+        assert response.status_code == 400
+
+    def test_sort_by_price_pages(
+        self, priced, product_factory, product_line_factory, api_client
+    ):
+        for slug in ("a", "b", "c"):
+            product_line_factory(product=product_factory(slug=slug), price=20)
+        client = api_client()
+        response = json.loads(
+            client.get(self.endpoint, {"sort": "-price", "page_size": 2}).content
+        )
+        slugs = [item["slug"] for item in response["results"]]
+        while response["next"]:
+            response = json.loads(client.get(response["next"]).content)
+            slugs += [item["slug"] for item in response["results"]]
+        assert slugs[0] == "pricey" and slugs[-1] == "cheap"
+        assert sorted(slugs[1:-1]) == ["a", "b", "c", "mid"]
+        response = client.get(self.endpoint, {"sort": "name"})
+        assert response.status_code == 400
+
+    def test_sparse_fields(self, catalog, api_client, django_assert_num_queries):
+        catalog(3)
+        params = {"fields": "name,category_name,min_price"}
+        # the product query only, no line, image or attribute is queried
+        with django_assert_num_queries(1):
+            response = api_client().get(self.endpoint, params)
+        results = json.loads(response.content)["results"]
+        assert len(results) == 3
+        assert set(results[0]) == {"name", "category_name", "min_price"}
+        # relations are only there when expanded, nested ones on their own
+        with django_assert_num_queries(2):
+            response = api_client().get(
+                self.endpoint, {"fields": "name", "expand": "product_line"}
+            )
+        line = json.loads(response.content)["results"][0]["product_line"][0]
+        assert set(line) == {"price", "sku", "stock_qty", "order"}
+        response = api_client().get(
+            self.endpoint,
+            {"expand": "product_line.specification,type_specification"},
+        )
+        product = json.loads(response.content)["results"][0]
+        assert "description" in product and "type specification" in product
+        assert set(product["product_line"][0]) == {
+            "price",
+            "sku",
+            "stock_qty",
+            "order",
+            "specification",
+        }
+        response = api_client().get(self.endpoint, {"fields": "name,sku"})
+        assert response.status_code == 400
+
+    def test_sparse_fields_sorted_by_price(self, priced, api_client):
+        response = api_client().get(self.endpoint, {"sort": "price", "fields": "slug"})
+        results = json.loads(response.content)["results"]
+        assert results == [{"slug": "cheap"}, {"slug": "mid"}, {"slug": "pricey"}]
+
+    def test_category_sorted_by_price_query_count(
+        self, catalog, category_factory, api_client, django_assert_num_queries
+    ):
+        category = category_factory(slug="test-slug")
+        catalog(5, category=category)
+        # the price range is part of the product query, nothing is added
+        with django_assert_num_queries(5):
+            api_client().get(
+                f"{self.endpoint}category/test-slug/all/",
+                {"sort": "price", "min_price": "1"},
+            )
+
+
+class TestProductLineEndpoints:
+    endpoint = "/api/productline/resolve/"
+
+    def resolve(self, api_client, skus):
+        return api_client().post(self.endpoint, {"skus": skus}, format="json")
+
+    def test_resolve_skus(self, product_line_factory, api_client):
+        line = product_line_factory(sku="a", price=9.5, stock_qty=3)
+        response = self.resolve(api_client, ["a", "x", "a"])
+        assert response.status_code == 200
+        assert json.loads(response.content) == {
+            "results": {
+                "a": {"product_id": line.product_id, "price": "9.50", "stock_qty": 3}
+            },
+            "missing": ["x"],
+        }
+
+    def test_resolve_skus_in_chunks(
+        self, product_line_factory, api_client, monkeypatch, django_assert_num_queries
+    ):
+        product_line_factory.create_batch(5)
+        skus = list(ProductLine.objects.values_list("sku", flat=True))
+        monkeypatch.setattr(connection.features, "max_query_params", 2)
+        with django_assert_num_queries(3):
+            response = self.resolve(api_client, skus)
+        assert len(json.loads(response.content)["results"]) == 5
+        # the cache is off by default, every request reads the database
+        with django_assert_num_queries(3):
+            self.resolve(api_client, skus)
+
+    def test_resolve_skus_cache_expires(
+        self, product_line_factory, api_client, monkeypatch, django_assert_num_queries
+    ):
+        monkeypatch.setattr(sku_cache, "size", 10)
+        product_line_factory(sku="a", stock_qty=3)
+        self.resolve(api_client, ["a"])
+        # resolved skus are served from memory for a few seconds
+        with django_assert_num_queries(0):
+            self.resolve(api_client, ["a"])
+        ProductLine.objects.filter(sku="a").update(stock_qty=1)
+        results = json.loads(self.resolve(api_client, ["a"]).content)["results"]
+        assert results["a"]["stock_qty"] == 3
+        monkeypatch.setattr(sku_cache, "timeout", -1)
+        sku_cache.clear()
+        self.resolve(api_client, ["a"])
+        results = json.loads(self.resolve(api_client, ["a"]).content)["results"]
+        assert results["a"]["stock_qty"] == 1
+
+    def test_resolve_skus_limit(self, api_client):
+        assert self.resolve(api_client, []).status_code == 400
+        assert self.resolve(api_client, ["a"] * 5001).status_code == 400
+
+    def test_sku_cache_evicts_least_recently_used(self):
+        cache = LRUCache(size=2, timeout=60)
+        cache.set_many({"a": 1, "b": 2})
+        cache.get_many(["a"])
+        cache.set_many({"c": 3})
+        assert cache.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+
+
+class TestAsyncEndpoints:
+    endpoint = "/api/async/"
+
+    @pytest.mark.parametrize(
+        "path",
+        [
+            "category/",
+            "category/tree/",
+            "product/",
+            "product/?fields=name,min_price&expand=product_line",
+            "product/?fields=nope",
+            "product/test-slug/",
+            "product/unknown/",
+        ],
+    )
+    def test_same_output_as_viewsets(self, path, catalog, category_factory, api_client):
+        category_factory(parent=category_factory())
+        catalog(2)
+        catalog(1, slug="test-slug")
+        # async first, so its own cache misses are covered as well
+        response = api_client().get(f"{self.endpoint}{path}")
+        expected = api_client().get(f"/api/{path}")
+        assert response.status_code == expected.status_code
+        assert response.content == expected.content
+
+    @pytest.mark.parametrize("path", ["category/", "product/", "product/test-slug/"])
+    def test_not_modified(self, path, catalog, category_factory, api_client):
+        category_factory()
+        catalog(1, slug="test-slug")
+        etag = api_client().get(f"{self.endpoint}{path}").headers["ETag"]
+        response = api_client().get(f"{self.endpoint}{path}", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_query_budget_in_async_mode(self, catalog, monkeypatch):
+        catalog(2)
+        client = AsyncClient()
+
+        @async_to_sync
+        async def get(path):
+            # AsyncClient runs the middleware chain in async mode, like ASGI
+            return await client.get(path)
+
+        response = get(f"{self.endpoint}product/")
+        assert 'desc="5 queries"' in response.headers["Server-Timing"]
+        monkeypatch.setattr(async_views.product_list, "query_budgets", {"get": 1})
+        with pytest.raises(QueryBudgetExceeded):
+            get(f"{self.endpoint}product/")
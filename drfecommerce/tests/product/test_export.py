@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from drfecommerce.product.export import export_products
+from drfecommerce.product.models import Product
+from drfecommerce.product.serializers import ProductSerializer
+
+pytestmark = pytest.mark.django_db
+
+
+def serialized():
+    products = Product.objects.is_active().with_related().order_by("pk")
+    return json.loads(json.dumps(ProductSerializer(products, many=True).data))
+
+
+class TestExportCatalog:
+    endpoint = "/api/product/export/"
+
+    def test_export_ndjson(self, catalog, product_factory, api_client):
+        catalog(3)
+        product_factory(is_active=False)
+        response = api_client().get(self.endpoint)
+        assert response.status_code == 200
+        assert response.streaming
+        assert response["Content-Type"] == "application/x-ndjson"
+        content = b"".join(response.streaming_content).decode()
+        assert [json.loads(line) for line in content.splitlines()] == serialized()
+
+    def test_export_csv(self, catalog, product_factory, api_client):
+        catalog(2)
+        product_factory()
+        response = api_client().get(self.endpoint, {"output": "csv"})
+        assert response["Content-Type"] == "text/csv"
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        # one row per line, the product without lines has an empty line part
+        assert len(rows) == 3
+        assert rows[2]["sku"] == ""
+        expected = serialized()[0]
+        assert rows[0]["slug"] == expected["slug"]
+        assert json.loads(rows[0]["product_image"]) == (
+            expected["product_line"][0]["product_image"]
+        )
+
+    def test_export_unknown_output(self, api_client):
+        response = api_client().get(self.endpoint, {"output": "xml"})
+        assert response.status_code == 400
+
+    def test_export_query_count_is_constant(self, catalog):
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                list(export_products(chunk_size=100))
+            return len(context)
+
+        catalog(2)
+        small = count_queries()
+        catalog(20)
+        assert count_queries() == small
+
+    def test_export_in_chunks(self, catalog):
+        catalog(5)
+        assert [p["slug"] for p in export_products(chunk_size=2)] == [
+            p["slug"] for p in serialized()
+        ]
+
+    def test_export_command(self, catalog, tmp_path):
+        catalog(2)
+        path = tmp_path / "catalog.ndjson"
+        call_command("export_catalog", path)
+        lines = path.read_text().splitlines()
+        assert [json.loads(line) for line in lines] == serialized()
@@ -0,0 +1,160 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from drfecommerce.product.importer import CatalogImporter
+from drfecommerce.product.models import Product, ProductDocument, ProductLine
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def record(category_factory, product_type_factory, attribute_factory):
+    category_factory(slug="shoes")
+    product_type_factory(name="shoe")
+    attribute_factory(name="color")
+    attribute_factory(name="size")
+
+    def create(pid, sku, **kwargs):
+        return {
+            "pid": pid,
+            "name": f"product {pid}",
+            "slug": f"product-{pid}",
+            "category": "shoes",
+            "product_type": "shoe",
+            "is_active": True,
+            "sku": sku,
+            "price": "9.99",
+            "stock_qty": 5,
+            "weight": 1.5,
+            "attributes": {"color": "red", "size": sku},
+            **kwargs,
+        }
+
+    return create
+
+
+class TestImportCatalog:
+    def test_import_jsonl(self, record, product_factory, tmp_path):
+        existing = product_factory(pid="p0")
+        ProductLine.objects.create(
+            product=existing,
+            product_type=existing.product_type,
+            price=1,
+            sku="old",
+            stock_qty=1,
+            weight=1,
+        )
+        path = tmp_path / "catalog.jsonl"
+        records = [
+            record("p1", "a"),
+            record("p1", "b"),
+            record("p2", "c"),
+            record("p0", "d"),
+        ]
+        path.write_text("\n".join(json.dumps(r) for r in records))
+        call_command("import_catalog", path)
+
+        assert Product.objects.count() == 3
+        lines = ProductLine.objects.order_by("sku")
+        assert [(line.product.pid, line.order) for line in lines] == [
+            ("p1", 1),
+            ("p1", 2),
+            ("p2", 1),
+            ("p0", 2),
+            ("p0", 1),
+        ]
+        specification = lines.get(sku="b").attribute_value.order_by("attribute__name")
+        assert [str(value) for value in specification] == ["color-red", "size-b"]
+        # values are shared, not created per line
+        assert lines.get(sku="a").attribute_value.get(attribute__name="color") in (
+            lines.get(sku="c").attribute_value.all()
+        )
+        assert Product.objects.get(pid="p1").last_line_order == 2
+
+    def test_import_csv(self, record, tmp_path):
+        path = tmp_path / "catalog.csv"
+        path.write_text(
+            "pid,name,slug,category,product_type,sku,price,stock_qty,weight,attributes\n"
+            "p1,shoe,shoe,shoes,shoe,a,9.99,5,1.5,color=red|size=42\n"
+            "p1,shoe,shoe,shoes,shoe,b,9.99,5,1.5,\n"
+        )
+        call_command("import_catalog", path)
+        product = Product.objects.get(pid="p1")
+        assert product.category.slug == "shoes"
+        assert product.product_line.count() == 2
+        assert product.product_line.get(sku="a").attribute_value.count() == 2
+
+    def test_invalid_records_are_skipped(self, record):
+        importer = CatalogImporter().run(
+            enumerate(
+                [
+                    record("p1", "a"),
+                    record("p2", "b", category="unknown"),
+                    record("p3", "c", price="1.001"),
+                    record("p4", "d", attributes={"unknown": "x"}),
+                    record("p5", "e", slug="product-p1"),
+                    record("p1", "a"),
+                ],
+                start=1,
+            )
+        )
+        assert [line_number for line_number, _ in importer.errors] == [2, 3, 4, 5, 6]
+        assert importer.lines_created == 1
+        # p3 and p4 have no valid line left, so they are not created either
+        assert set(Product.objects.values_list("pid", flat=True)) == {"p1"}
+
+    def test_failed_products_stay_failed_across_batches(self, record):
+        importer = CatalogImporter(batch_size=1).run(
+            enumerate(
+                [record("p1", "a", category="unknown"), record("p1", "b")], start=1
+            )
+        )
+        assert [line_number for line_number, _ in importer.errors] == [1, 2]
+        assert not Product.objects.exists()
+
+    def test_query_count_does_not_grow_with_batch(self, record):
+        def run(size):
+            records = enumerate(
+                [record(f"{size}-{n}", f"{size}-{n}") for n in range(size)], start=1
+            )
+            with CaptureQueriesContext(connection) as queries:
+                CatalogImporter(batch_size=size).run(records)
+            return len(queries)
+
+        assert run(2) == run(20)
+
+    def test_documents_refreshed(self, record, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            CatalogImporter().run([(1, record("p1", "a"))])
+        document = ProductDocument.objects.get().document
+        assert document["product_line"][0]["sku"] == "a"
+
+    def test_product_without_category(
+        self, record, api_client, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            importer = CatalogImporter()
+            importer.run([(1, record("p1", "a", category=None))])
+        assert importer.errors == []
+        document = ProductDocument.objects.get().document
+        assert document["category_name"] is None
+        response = api_client().get("/api/product/")
+        assert response.data["results"][0]["category_name"] is None
+
+    def test_skip_documents_still_invalidates(
+        self, record, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            CatalogImporter().run([(1, record("p1", "a"))])
+        with django_capture_on_commit_callbacks(execute=True):
+            CatalogImporter(refresh_documents=False).run([(1, record("p1", "b"))])
+        product = Product.objects.get()
+        # the document is left for rebuild_product_documents, the rest is refreshed
+        assert [line["sku"] for line in product.document.document["product_line"]] == [
+            "a"
+        ]
+        assert product.updated_at > product.document.updated_at
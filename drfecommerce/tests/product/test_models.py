@@ -1,8 +1,13 @@
 import pytest
 from django.core.exceptions import ValidationError
+from django.db import models
 from django.db.utils import IntegrityError
 
-from drfecommerce.product.models import Category
+from drfecommerce.product.models import (
+    Category,
+    ProductLine,
+    ProductLineAttributeValue,
+)
 
 pytestmark = pytest.mark.django_db  # otherwise get error that test has no access to db.
 
@@ -74,7 +79,7 @@ class TestProductLineModel:
         product_line_factory,
         attribute_factory,
         attribute_value_factory,
-        product_line_attribute_value_factory
+        product_line_attribute_value_factory,
     ):
         obj1 = attribute_factory(name="shoe-color")
         obj2 = attribute_value_factory(attribute_value="red", attribute=obj1)
@@ -85,7 +90,7 @@ class TestProductLineModel:
             product_line_attribute_value_factory(
                 attribute_value=obj3, product_line=obj4
             )
-    
+
     def test_str_method(self, product_line_factory):
         # attr = attribute_value_factory(attribute_value="test_123")
         data = product_line_factory(sku="123")
@@ -110,6 +115,133 @@ class TestProductLineModel:
         with pytest.raises(ValidationError):
             product_line_factory(price=price)
 
+    def test_duplicate_order_check_is_one_query(
+        self, product_line_factory, django_assert_num_queries
+    ):
+        obj = product_line_factory(order=1)
+        with django_assert_num_queries(1):
+            obj.clean()
+
+    def test_duplicate_order_values_rejected_by_database(
+        self, product_line_factory, product_factory
+    ):
+        product = product_factory()
+        obj = product_line_factory(order=1, product=product)
+        obj.pk = None
+        with pytest.raises(IntegrityError):
+            # bulk_create skips clean(), the unique constraint still applies
+            ProductLine.objects.bulk_create([obj])
+
+    def test_order_constraint_validated_by_clean_only(
+        self, product_line_factory, django_assert_num_queries
+    ):
+        obj = product_line_factory(order=1)
+        with django_assert_num_queries(0):
+            obj.validate_constraints()
+        duplicate = ProductLine(product=obj.product, order=1)
+        with pytest.raises(ValidationError):
+            duplicate.clean()
+
+    def test_other_constraints_are_validated(self, product_line_factory, monkeypatch):
+        obj = product_line_factory(order=1)
+        obj.pk = None
+        # constraints that clean() doesn't check are validated by save() as usual
+        monkeypatch.setattr(ProductLine, "checked_in_clean", [])
+        with pytest.raises(ValidationError):
+            obj.validate_constraints()
+
+    def test_set_attribute_values(
+        self,
+        product_line_factory,
+        attribute_value_factory,
+        django_assert_num_queries,
+    ):
+        obj = product_line_factory()
+        values = attribute_value_factory.create_batch(5)
+        # one check and one insert (within a savepoint), however many values
+        with django_assert_num_queries(4):
+            obj.set_attribute_values(values)
+        assert set(obj.attribute_value.all()) == set(values)
+        # values that are already set are skipped
+        with django_assert_num_queries(1):
+            obj.set_attribute_values(values[:2])
+
+    def test_set_attribute_values_one_value_per_attribute(
+        self, product_line_factory, attribute_factory, attribute_value_factory
+    ):
+        obj = product_line_factory()
+        attribute = attribute_factory()
+        red, blue = attribute_value_factory.create_batch(2, attribute=attribute)
+        with pytest.raises(ValidationError):
+            obj.set_attribute_values([red, blue])
+        obj.set_attribute_values([red])
+        with pytest.raises(ValidationError):
+            obj.set_attribute_values([blue])
+        assert list(obj.attribute_value.all()) == [red]
+
+    def test_duplicate_attribute_rejected_by_database(
+        self, product_line_factory, attribute_factory, attribute_value_factory
+    ):
+        obj = product_line_factory()
+        attribute = attribute_factory()
+        red, blue = attribute_value_factory.create_batch(2, attribute=attribute)
+        obj.set_attribute_values([red])
+        with pytest.raises(IntegrityError):
+            ProductLineAttributeValue.objects.bulk_create(
+                [
+                    ProductLineAttributeValue(
+                        product_line=obj, attribute_value=blue, attribute=attribute
+                    )
+                ]
+            )
+
+    def test_attribute_copy_follows_attribute_value(
+        self, product_line_factory, attribute_factory, attribute_value_factory
+    ):
+        value = attribute_value_factory()
+        link = ProductLineAttributeValue.objects.create(
+            product_line=product_line_factory(), attribute_value=value
+        )
+        assert link.attribute_id == value.attribute_id
+        value.attribute = attribute_factory()
+        value.save()
+        link.refresh_from_db()
+        assert link.attribute_id == value.attribute_id
+
+    def test_many_to_many_api_fills_in_attribute(
+        self, product_line_factory, attribute_factory, attribute_value_factory
+    ):
+        obj = product_line_factory()
+        red, blue = attribute_value_factory.create_batch(
+            2, attribute=attribute_factory()
+        )
+        size = attribute_value_factory()
+        obj.attribute_value.add(red, size)
+        obj.attribute_value.set([blue, size])
+        obj.attribute_value.create(attribute_value="new", attribute=attribute_factory())
+        size.product_line_attribute_value.add(product_line_factory())
+        assert not ProductLineAttributeValue.objects.exclude(
+            attribute=models.F("attribute_value__attribute")
+        ).exists()
+        assert set(obj.attribute_value.exclude(attribute_value="new")) == {blue, size}
+        with pytest.raises(IntegrityError):
+            # still one value per attribute, checked by the database
+            obj.attribute_value.add(red)
+
+    def test_attribute_value_cannot_move_to_taken_attribute(
+        self, product_line_factory, attribute_factory, attribute_value_factory
+    ):
+        obj = product_line_factory()
+        red, small = attribute_value_factory.create_batch(2)
+        obj.set_attribute_values([red, small])
+        small.attribute = red.attribute
+        with pytest.raises(ValidationError):
+            small.clean()
+        with pytest.raises(ValidationError):
+            small.save()
+        small.refresh_from_db()
+        assert small.attribute_id != red.attribute_id
+
 
 class TestProductImageModel:
     def test_str_method(self, product_image_factory, product_line_factory):
@@ -117,6 +249,12 @@ class TestProductImageModel:
         obj2 = product_image_factory(order=1, product_line=obj1)
         assert obj2.__str__() == "12345_img"
 
+    def test_duplicate_order_values(self, product_image_factory, product_line_factory):
+        product_line = product_line_factory()
+        product_image_factory(order=1, product_line=product_line)
+        with pytest.raises(ValidationError):
+            product_image_factory(order=1, product_line=product_line)
+
 
 class TestProductTypeModel:
     def test_str_method(self, product_type_factory):
@@ -136,3 +274,39 @@ class TestAttributeModel:
     def test_str_method(self, attribute_factory):
         obj = attribute_factory.create(name="test_attribute")
         assert obj.__str__() == "test_attribute"
+
+
+class TestOrderField:
+    def test_order_increments_per_product(self, product_line_factory, product_factory):
+        product = product_factory()
+        obj1 = product_line_factory(product=product)
+        obj2 = product_line_factory(product=product)
+        obj3 = product_line_factory()
+        assert (obj1.order, obj2.order, obj3.order) == (1, 2, 1)
+        product.refresh_from_db()
+        assert product.last_line_order == 2
+
+    def test_order_skips_manual_values(
+        self, product_image_factory, product_line_factory
+    ):
+        product_line = product_line_factory()
+        product_image_factory(product_line=product_line, order=5)
+        obj = product_image_factory(product_line=product_line)
+        assert obj.order == 6
+
+    def test_assign_allocates_once_per_product(
+        self, product_factory, product_line_factory, django_assert_num_queries
+    ):
+        products = product_factory.create_batch(2)
+        product_line_factory(product=products[0])
+        lines = [
+            ProductLine(product=product, price=1, sku="sku", stock_qty=1, weight=1)
+            for product in products * 3
+        ]
+        # one UPDATE and one SELECT per product, inside a savepoint each
+        with django_assert_num_queries(8):
+            ProductLine._meta.get_field("order").assign(lines)
+        orders = sorted((line.product_id, line.order) for line in lines)
+        assert orders == [(products[0].pk, n) for n in (2, 3, 4)] + [
+            (products[1].pk, n) for n in (1, 2, 3)
+        ]
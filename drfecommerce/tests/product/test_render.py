@@ -0,0 +1,106 @@
+import pytest
+from django.core.files.storage import FileSystemStorage
+from django.db.models import prefetch_related_objects
+from rest_framework.renderers import JSONRenderer
+
+from drfecommerce.product.models import Product, ProductImage, ProductQueryset
+from drfecommerce.product.render import (
+    image_url_extractor,
+    product_values,
+    render_products,
+)
+from drfecommerce.product.serializers import ProductSerializer
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def products(
+    product_factory,
+    product_line_factory,
+    product_image_factory,
+    attribute_factory,
+    attribute_value_factory,
+    product_type_factory,
+):
+    # several lines, images and specification values per product, inactive lines,
+    # a product without lines, one without category and two product types.
+    attributes = attribute_factory.create_batch(3)
+    product_types = [
+        product_type_factory(attribute=attributes),
+        product_type_factory(attribute=attributes[1:]),
+    ]
+    values = [attribute_value_factory(attribute=attribute) for attribute in attributes]
+    for n in range(6):
+        kwargs = {"category": None} if n == 5 else {}
+        product = product_factory(product_type=product_types[n % 2], **kwargs)
+        for m in range(n % 3):
+            product_line = product_line_factory(
+                product=product, price=10 * n + m, is_active=m != 1
+            )
+            product_line.set_attribute_values(values[m:])
+            product_image_factory.create_batch(m, product_line=product_line)
+
+
+def serialized(fields=None):
+    page = list(Product.objects.with_related(fields).prefetch_related(None))
+    prefetch_related_objects(page, *ProductQueryset.prefetch_lookups(fields))
+    return JSONRenderer().render(ProductSerializer(page, many=True, fields=fields).data)
+
+
+def rendered(fields=None):
+    rows = Product.objects.with_related(fields).values(*product_values(fields))
+    return JSONRenderer().render(render_products(rows, fields))
+
+
+class TestRenderProducts:
+    @pytest.mark.parametrize(
+        "fields",
+        [
+            None,
+            {"name", "category_name", "min_price"},
+            {"slug", "max_price", "product_line"},
+            {"name", "product_line", "product_line.product_image"},
+            {"description", "product_line", "product_line.specification"},
+            {"type_specification"},
+        ],
+    )
+    def test_same_output_as_serializer(self, products, fields):
+        output = serialized(fields)
+        assert output.startswith(b"[{")
+        assert rendered(fields) == output
+
+    def test_same_queries_as_prefetch(self, products, django_assert_num_queries):
+        # the page, lines, images, specifications, type attributes
+        with django_assert_num_queries(5):
+            rendered()
+
+    @pytest.mark.parametrize(
+        "name",
+        ["", "test.jpg", "/a/b c.jpg", "ü.png", "./x.jpg", "a/../b.jpg", "c:x.jpg"],
+    )
+    def test_image_url(self, name, settings):
+        settings.MEDIA_URL = "/media/"
+        storage = ProductImage._meta.get_field("url").storage
+        expected = storage.url(name) if name else None
+        assert image_url_extractor()(name) == expected
+
+    def test_image_url_of_custom_storage(self, monkeypatch):
+        # a subclass of FileSystemStorage with its own url() is not bypassed
+        class VersionedStorage(FileSystemStorage):
+            def url(self, name):
+                return super().url(name) + "?v=1"
+
+        field = ProductImage._meta.get_field("url")
+        monkeypatch.setattr(field, "storage", VersionedStorage(base_url="/media/"))
+        assert image_url_extractor()("test.jpg") == "/media/test.jpg?v=1"
+
+    def test_listing_fast_path(self, products, api_client, settings):
+        client = api_client()
+        params = {"sort": "price", "expand": "product_line.specification"}
+        settings.PRODUCT_FAST_RENDER = False
+        responses = [client.get("/api/product/", params).content]
+        settings.PRODUCT_FAST_RENDER = True
+        responses.append(client.get("/api/product/", params).content)
+        assert b"specification" in responses[0]
+        assert responses[0] == responses[1]
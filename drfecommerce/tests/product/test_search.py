@@ -0,0 +1,121 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+
+from drfecommerce.product.search import (
+    BasicSearchBackend,
+    SearchBackend,
+    index_products,
+    search_backend,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+class TestProductSearch:
+    endpoint = "/api/product/search/"
+
+    def search(self, api_client, q, **params):
+        response = api_client().get(self.endpoint, {"q": q, **params})
+        assert response.status_code == 200
+        return [item["slug"] for item in json.loads(response.content)["results"]]
+
+    def test_search_ranks_name_first(self, product_factory, api_client):
+        in_description = product_factory(slug="b", description="a red running shoe")
+        in_name = product_factory(slug="a", name="Running shoe")
+        product_factory(name="Sandal")
+        index_products([in_description.pk, in_name.pk])
+        assert self.search(api_client, "shoe") == ["a", "b"]
+        # every word has to match, words are matched as prefix
+        assert self.search(api_client, "run sho") == ["a", "b"]
+        assert self.search(api_client, "red shoe") == ["b"]
+
+    def test_search_category_and_specification(
+        self, product_factory, product_line_factory, attribute_value_factory, api_client
+    ):
+        product = product_factory(slug="shirt", category__name="Shirts")
+        product_line_factory(product=product).set_attribute_values(
+            [attribute_value_factory(attribute_value="Crimson")]
+        )
+        index_products([product.pk])
+        assert self.search(api_client, "shirts") == ["shirt"]
+        assert self.search(api_client, "crimson") == ["shirt"]
+
+    def test_search_index_follows_changes(
+        self, product_factory, api_client, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            product = product_factory(slug="hat", name="Hat")
+        assert self.search(api_client, "hat") == ["hat"]
+        with django_capture_on_commit_callbacks(execute=True):
+            product.name = "Cap"
+            product.save()
+        assert self.search(api_client, "hat") == []
+        assert self.search(api_client, "cap") == ["hat"]
+        with django_capture_on_commit_callbacks(execute=True):
+            product.is_active = False
+            product.save()
+        assert self.search(api_client, "cap") == []
+        assert search_backend().search("cap", 10) == []
+
+    def test_unknown_database_falls_back_to_basic_search(self, monkeypatch):
+        monkeypatch.setattr(connections["default"], "vendor", "mysql")
+        assert isinstance(search_backend(), BasicSearchBackend)
+        with pytest.raises(TypeError):
+            # delete/insert/match (or index/search) have to be implemented
+            SearchBackend()
+
+    def test_basic_search(
+        self,
+        product_factory,
+        product_line_factory,
+        attribute_value_factory,
+        api_client,
+        settings,
+    ):
+        settings.PRODUCT_SEARCH_BACKEND = (
+            "drfecommerce.product.search.BasicSearchBackend"
+        )
+        product_factory(slug="b", description="a red running shoe")
+        product_factory(slug="a", name="Running shoe")
+        product_factory(name="Sandal")
+        product_line_factory(product__slug="c").set_attribute_values(
+            [attribute_value_factory(attribute_value="Crimson")]
+        )
+        assert self.search(api_client, "shoe") == ["a", "b"]
+        assert self.search(api_client, "red sho") == ["b"]
+        assert self.search(api_client, "crimson") == ["c"]
+        assert self.search(api_client, "% (") == []
+
+    def test_search_query_syntax_is_ignored(self, product_factory, api_client):
+        index_products([product_factory(name="Shoe").pk])
+        assert self.search(api_client, "") == []
+        assert self.search(api_client, '" OR (') == []
+        assert len(self.search(api_client, 'shoe" *(')) == 1
+
+    def test_search_query_count_is_constant(
+        self, product_factory, api_client, django_assert_num_queries
+    ):
+        products = product_factory.create_batch(3, name="Shoe")
+        index_products([product.pk for product in products])
+        # search, products, product lines, type attributes
+        with django_assert_num_queries(4):
+            assert len(self.search(api_client, "shoe", page_size=2)) == 2
+
+    def test_index_in_chunks(self, product_factory, api_client, monkeypatch):
+        products = product_factory.create_batch(5, name="Shoe")
+        monkeypatch.setattr(connection.features, "max_query_params", 2)
+        with CaptureQueriesContext(connection) as queries:
+            index_products([product.pk for product in products])
+        deletes = [query for query in queries if query["sql"].startswith("DELETE")]
+        assert len(deletes) == 3
+        monkeypatch.undo()
+        assert len(self.search(api_client, "shoe")) == 5
+
+    def test_rebuild_search_index(self, product_factory, api_client):
+        product_factory.create_batch(3, name="Shoe")
+        call_command("rebuild_search_index", batch_size=2)
+        assert len(self.search(api_client, "shoe")) == 3
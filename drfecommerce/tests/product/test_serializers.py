@@ -0,0 +1,42 @@
+import pytest
+
+from drfecommerce.product.models import Product
+from drfecommerce.product.serializers import ProductSerializer
+
+pytestmark = pytest.mark.django_db
+
+
+class TestProductSerializer:
+    def test_type_specification(
+        self, product_factory, product_type_factory, attribute_factory
+    ):
+        obj1 = attribute_factory(name="size")
+        obj2 = attribute_factory(name="color")
+        product = product_factory(
+            product_type=product_type_factory(attribute=[obj1, obj2])
+        )
+        data = ProductSerializer(product).data
+        assert data["type specification"] == {obj1.id: "size", obj2.id: "color"}
+        assert "attribute" not in data
+
+    def test_attributes_resolved_once_per_product_type(
+        self,
+        product_factory,
+        product_type_factory,
+        attribute_factory,
+        django_assert_num_queries,
+    ):
+        product_type = product_type_factory(attribute=[attribute_factory()])
+        product_factory.create_batch(5, product_type=product_type)
+        product_factory(
+            product_type=product_type_factory(attribute=[attribute_factory()])
+        )
+        products = list(
+            Product.objects.select_related("category", "product_type").prefetch_related(
+                "product_line"
+            )
+        )
+        # one query per distinct product type, not per product
+        with django_assert_num_queries(2):
+            data = ProductSerializer(products, many=True).data
+        assert len({tuple(item["type specification"]) for item in data}) == 2
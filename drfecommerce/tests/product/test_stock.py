@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from drfecommerce.product.cache import facet_index_version, product_versions
+from drfecommerce.product.models import Product, ProductDocument, ProductLine
+from drfecommerce.product.stock import release_stock, reserve_stock
+
+pytestmark = pytest.mark.django_db
+
+
+def stock(sku):
+    return ProductLine.objects.get(sku=sku).stock_qty
+
+
+class TestStockReservation:
+    def test_reserve_stock(self, product_line_factory, django_assert_num_queries):
+        product_line_factory(sku="a", stock_qty=5)
+        product_line_factory(sku="b", stock_qty=1)
+        # one conditional update per line, plus the products of the changed lines
+        with django_assert_num_queries(5):
+            assert reserve_stock({"a": 2, "b": 1}) == {"a": True, "b": True}
+        assert stock("a") == 3
+        assert stock("b") == 0
+
+    def test_reserve_stock_is_all_or_nothing(self, product_line_factory):
+        product_line_factory(sku="a", stock_qty=5)
+        product_line_factory(sku="b", stock_qty=1)
+        product_line_factory(sku="c", stock_qty=9, is_active=False)
+        assert reserve_stock({"a": 2, "b": 2}) == {"a": True, "b": False}
+        assert reserve_stock({"a": 2, "c": 1}) == {"a": True, "c": False}
+        assert reserve_stock({"a": 2, "x": 1}) == {"a": True, "x": False}
+        assert stock("a") == 5
+        assert stock("b") == 1
+
+    def test_reserve_stock_partial(self, product_line_factory):
+        product_line_factory(sku="a", stock_qty=5)
+        product_line_factory(sku="b", stock_qty=1)
+        results = reserve_stock({"a": 5, "b": 2}, partial=True)
+        assert results == {"a": True, "b": False}
+        assert stock("a") == 0
+        assert stock("b") == 1
+        # the last items can only be reserved once
+        assert reserve_stock({"a": 1}) == {"a": False}
+
+    def test_release_stock(self, product_line_factory):
+        product_line_factory(sku="a", stock_qty=0)
+        assert release_stock({"a": 3, "x": 1}) == {"a": True, "x": False}
+        assert stock("a") == 3
+
+    @pytest.mark.parametrize("quantity", [0, -1, 1.5])
+    def test_invalid_quantity(self, quantity):
+        with pytest.raises(ValueError):
+            reserve_stock({"a": quantity})
+
+    def test_documents_refreshed(
+        self, product_line_factory, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            product_line = product_line_factory(sku="a", stock_qty=5)
+        with django_capture_on_commit_callbacks(execute=True):
+            reserve_stock({"a": 2})
+        document = ProductDocument.objects.get(pk=product_line.product_id).document
+        assert document["product_line"][0]["stock_qty"] == 3
+
+    def test_only_stock_is_refreshed(
+        self, product_line_factory, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            product = product_line_factory(sku="a", stock_qty=5).product
+        product.refresh_from_db()
+        facets = facet_index_version()
+        versions = product_versions([product.pk])
+        with django_capture_on_commit_callbacks(execute=True):
+            reserve_stock({"a": 2})
+            release_stock({"a": 1})
+        # the cached responses are invalidated, the facet index is kept
+        assert product_versions([product.pk]) != versions
+        assert facet_index_version() == facets
+
+    def test_validators_follow_stock(
+        self, product_line_factory, api_client, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            product = product_line_factory(sku="a", stock_qty=5).product
+        # Last-Modified has a resolution of one second
+        Product.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        list_endpoint = "/api/product/"
+        detail_endpoint = f"/api/product/{product.slug}/"
+        etag = api_client().get(list_endpoint).headers["ETag"]
+        response = api_client().get(detail_endpoint)
+        detail_etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+        with django_capture_on_commit_callbacks(execute=True):
+            reserve_stock({"a": 5})
+        response = api_client().get(list_endpoint, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.data["results"][0]["product_line"][0]["stock_qty"] == 0
+        response = api_client().get(detail_endpoint, HTTP_IF_NONE_MATCH=detail_etag)
+        assert response.status_code == 200
+        assert response.data[0]["product_line"][0]["stock_qty"] == 0
+        response = api_client().get(
+            detail_endpoint, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        assert response.status_code == 200
@@ -0,0 +1,60 @@
+import logging
+
+import pytest
+
+from drfecommerce.middleware import QueryBudgetExceeded, fingerprint
+from drfecommerce.product.models import ProductQueryset
+from drfecommerce.product.views import ProductViewSet
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def n_plus_one(monkeypatch, settings):
+    # serializer path without prefetching: every product queries its own relations
+    settings.PRODUCT_FAST_RENDER = False
+    monkeypatch.setattr(
+        ProductQueryset, "prefetch_lookups", staticmethod(lambda fields=None: [])
+    )
+
+
+class TestQueryBudgetMiddleware:
+    endpoint = "/api/product/"
+
+    def test_server_timing(self, product_line_factory, api_client):
+        product_line_factory()
+        response = api_client().get(self.endpoint)
+        assert response.headers["Server-Timing"].startswith("db;dur=")
+        assert 'desc="5 queries"' in response.headers["Server-Timing"]
+
+    def test_n_plus_one_fails(self, product_line_factory, api_client, n_plus_one):
+        product_line_factory.create_batch(3)
+        with pytest.raises(QueryBudgetExceeded, match="Repeated queries") as e:
+            api_client().get(self.endpoint)
+        assert "GET product-list ran" in str(e.value)
+
+    def test_over_budget_logs_warning(
+        self, product_line_factory, api_client, n_plus_one, settings, caplog
+    ):
+        settings.QUERY_BUDGET_STRICT = False
+        product_line_factory.create_batch(3)
+        with caplog.at_level(logging.INFO, logger="drfecommerce.queries"):
+            response = api_client().get(self.endpoint)
+        assert response.status_code == 200
+        assert "db-dup" in response.headers["Server-Timing"]
+        info, warning = caplog.records
+        assert info.view == "product-list" and info.queries > 7
+        assert info.duplicates[0][0] == 3
+        assert warning.levelname == "WARNING"
+
+    def test_budget_per_action(self, product_factory, api_client, monkeypatch):
+        product_factory(slug="test-slug")
+        monkeypatch.setattr(ProductViewSet, "query_budgets", {"retrieve": 1})
+        api_client().get(self.endpoint)
+        with pytest.raises(QueryBudgetExceeded):
+            api_client().get(f"{self.endpoint}test-slug/")
+
+    def test_fingerprint(self):
+        assert fingerprint("SELECT 1 WHERE id IN (%s, %s, %s)") == fingerprint(
+            "SELECT 1 WHERE id IN (%s)"
+        )
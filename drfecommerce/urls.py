@@ -3,16 +3,30 @@ from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from rest_framework.routers import DefaultRouter
 
-from drfecommerce.product import views
+from drfecommerce.product import async_views, views
 
 router = DefaultRouter()
 router.register(r"category", views.CategoryViewSet)
 router.register(r"product", views.ProductViewSet)
+router.register(r"productline", views.ProductLineViewSet)
 
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(router.urls)),
+    # async versions of the busiest endpoints, for ASGI (see product/async_views.py)
+    path("api/async/category/", async_views.category_list, name="async-category-list"),
+    path(
+        "api/async/category/tree/",
+        async_views.category_tree,
+        name="async-category-tree",
+    ),
+    path("api/async/product/", async_views.product_list, name="async-product-list"),
+    path(
+        "api/async/product/<str:slug>/",
+        async_views.product_detail,
+        name="async-product-detail",
+    ),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/schema/docs/", SpectacularSwaggerView.as_view(url_name="schema")),
 ]
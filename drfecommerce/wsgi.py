@@ -11,6 +11,12 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drfecommerce.settings")
+from drfecommerce.settings import base
+
+# same choice as manage.py, drfecommerce.settings itself is empty
+if base.DEBUG:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drfecommerce.settings.local")
+else:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "drfecommerce.settings.production")
 
 application = get_wsgi_application()